@@ -0,0 +1,258 @@
+"""
+Content-addressed cache for audio extracted from videos.
+
+Cache entries are keyed by the SHA-256 of the source video's bytes plus the
+ffmpeg parameters used to produce them, so renamed/moved videos still hit the
+cache, re-encoded sources are always re-extracted, and two videos that share a
+basename can never be confused with each other.
+
+Hashing a large video is expensive, so the manifest also remembers the
+(size, mtime, inode) of every source it has hashed. As long as those do not
+change, a rerun over an archive costs a single os.stat() per file.
+
+The manifest is a small SQLite database stored next to the cached files, and
+the cache is trimmed least-recently-used first once it grows past max_bytes.
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+# Bump when the layout or the meaning of a key changes, invalidates all entries
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = "testing_audios/cache"
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3  # 20 GB
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class CacheEntryEvicted(FileNotFoundError):
+    """The cached file of an entry was removed (e.g. evicted by another worker) before it could be used"""
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SourceHashes:
+    """
+    Remembers the content hash of every file it has hashed together with its
+    (size, mtime, inode), so asking again for an unchanged file costs a
+    single os.stat(). Stored in a small SQLite database; safe to share
+    between threads.
+    """
+
+    def __init__(self, db_path):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def content_hash(self, path):
+        """
+        Return the content hash of a file, re-hashing it only when its size,
+        mtime or inode changed since the last time it was seen.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, inode, content_hash FROM sources WHERE path = ?", (path,)
+            ).fetchone()
+        if row and tuple(row[:3]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return row[3]
+
+        content_hash = hash_file(path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources (path, size, mtime_ns, inode, content_hash) VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, st.st_ino, content_hash)
+            )
+            self._db.commit()
+        return content_hash
+
+
+class AudioCache:
+    """
+    On-disk cache of extracted audio files with a SQLite manifest and
+    LRU eviction by total size. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        manifest_path = os.path.join(cache_dir, "manifest.sqlite3")
+        self._sources = SourceHashes(manifest_path)
+        self._db = sqlite3.connect(manifest_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                extension TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS outputs (
+                path TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                source TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        self._sources.close()
+
+    # --- Keys -----------------------------------------------------------------
+
+    def content_hash(self, video_path):
+        """Return the content hash of a source video, see SourceHashes"""
+        return self._sources.content_hash(video_path)
+
+    def key_for(self, video_path, params):
+        """Cache key for a source video processed with the given ffmpeg parameters"""
+        payload = json.dumps({
+            'version': CACHE_VERSION,
+            'source': self.content_hash(video_path),
+            'params': list(params),
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def object_path(self, key, extension=".wav"):
+        return os.path.join(self.objects_dir, key[:2], key + extension)
+
+    # --- Entries --------------------------------------------------------------
+
+    def lookup(self, key, extension=".wav"):
+        """Return the cached file for key (marking it recently used), or None"""
+        path = self.object_path(key, extension)
+        with self._lock:
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(path) or os.path.getsize(path) != row[0]:
+                # Entry was removed or damaged behind our back, forget it
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return path
+
+    def staging_path(self, key, extension=".wav"):
+        """Temporary path to write a new entry to before calling store()"""
+        path = self.object_path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+
+    def store(self, key, staged_path, extension=".wav"):
+        """Atomically move a finished staging file into the cache and trim it"""
+        path = self.object_path(key, extension)
+        os.replace(staged_path, path)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, extension, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, extension, os.path.getsize(path), now, now)
+            )
+            self._db.commit()
+        self.evict(keep=key)
+        return path
+
+    def evict(self, keep=None):
+        """Remove least-recently-used entries until the cache fits in max_bytes"""
+        removed = []
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return removed
+            rows = self._db.execute("SELECT key, extension, size FROM entries ORDER BY last_access ASC").fetchall()
+            for key, extension, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                path = self.object_path(key, extension)
+                if os.path.exists(path):
+                    os.remove(path)
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                removed.append(key)
+            self._db.commit()
+        return removed
+
+    # --- Outputs --------------------------------------------------------------
+
+    def materialize(self, key, cached_path, output_path, video_path):
+        """
+        Make output_path hold the cached file for key.
+
+        Returns False without touching anything when output_path is already
+        up to date. Raises FileExistsError if output_path was produced from a
+        different source video (e.g. same basename in another folder), and
+        CacheEntryEvicted if the cached file disappeared since lookup(); the
+        entry is then forgotten and the caller should treat it as a miss.
+        """
+        output_path = os.path.abspath(output_path)
+        source = os.path.abspath(video_path)
+        with self._lock:
+            row = self._db.execute("SELECT key, source FROM outputs WHERE path = ?", (output_path,)).fetchone()
+        if row and row[1] != source and os.path.exists(output_path) and os.path.exists(row[1]):
+            raise FileExistsError(
+                f"{output_path} already holds audio from {row[1]}; refusing to overwrite it with {source}"
+            )
+        if row and row[0] == key and os.path.exists(output_path) and os.path.exists(cached_path) \
+                and os.path.getsize(output_path) == os.path.getsize(cached_path):
+            return False
+
+        tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # A copy, not a hard link, so editing the output in place cannot change the cache entry
+            shutil.copyfile(cached_path, tmp_path)
+        except FileNotFoundError:
+            # Another worker evicted the entry between lookup() and here
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self._lock:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+            raise CacheEntryEvicted(f"cached file for {key} was evicted before it could be used")
+        os.replace(tmp_path, output_path)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO outputs (path, key, source) VALUES (?, ?, ?)",
+                (output_path, key, source)
+            )
+            self._db.commit()
+        return True
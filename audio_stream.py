@@ -0,0 +1,179 @@
+"""
+Stream decoded audio straight out of ffmpeg as NumPy blocks.
+
+Instead of extracting a WAV to disk and reading it back, ffmpeg writes raw
+PCM to its stdout and stream_audio_blocks() hands it out block by block, so
+consumers (ASR runners, silence detection) can start working before the
+whole file has been decoded and nothing intermediate touches the disk.
+"""
+
+import queue
+import subprocess
+import threading
+
+import numpy as np
+
+# ffmpeg raw formats for the NumPy dtypes we support
+PCM_FORMATS = {
+    'int16': ('s16le', 'pcm_s16le'),
+    'float32': ('f32le', 'pcm_f32le'),
+}
+
+
+def build_pcm_stream_command(source_path, sample_rate=16000, channels=1, dtype='int16'):
+    """Build the ffmpeg command that decodes source_path to raw PCM on stdout"""
+    raw_format, codec = PCM_FORMATS[dtype]
+    return [
+        'ffmpeg',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-i', source_path,
+        '-vn',  # No video
+        '-acodec', codec,
+        '-ar', str(sample_rate),
+        '-ac', str(channels),
+        '-f', raw_format,
+        'pipe:1'
+    ]
+
+
+def stream_audio_blocks(source_path, sample_rate=16000, channels=1, block_size=16000, dtype='int16'):
+    """
+    Decode any audio/video file with ffmpeg and yield its audio as NumPy arrays.
+
+    Args:
+        source_path (str): Audio or video file readable by ffmpeg.
+        sample_rate (int): Output sample rate in Hz (default: 16000).
+        channels (int): Output channel count (default: 1).
+        block_size (int): Samples per channel in each block (default: 16000 = 1 s at 16 kHz).
+            The last block may be shorter.
+        dtype (str): 'int16' or 'float32' (float32 samples are in [-1.0, 1.0]).
+
+    Yields:
+        np.ndarray: shape (n,) for mono or (n, channels) otherwise.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails to decode the source.
+    """
+    if dtype not in PCM_FORMATS:
+        raise ValueError(f"Unsupported dtype {dtype!r}, expected one of {list(PCM_FORMATS)}")
+
+    np_dtype = np.dtype(dtype).newbyteorder('<')
+    frame_bytes = np_dtype.itemsize * channels
+    block_bytes = frame_bytes * block_size
+
+    command = build_pcm_stream_command(source_path, sample_rate, channels, dtype)
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Drain stderr on the side so a chatty ffmpeg can never block on a full pipe
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+
+    try:
+        pending = b''
+        while True:
+            data = process.stdout.read(block_bytes - len(pending))
+            if not data:
+                break
+            pending += data
+            if len(pending) < block_bytes:
+                continue
+            yield _to_block(pending, np_dtype, channels)
+            pending = b''
+
+        # Drop a trailing partial frame, ffmpeg never emits one unless it died mid-write
+        usable = len(pending) - len(pending) % frame_bytes
+        if usable:
+            yield _to_block(pending[:usable], np_dtype, channels)
+
+        returncode = process.wait()
+        stderr_thread.join()
+        if returncode != 0:
+            stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+            raise subprocess.CalledProcessError(returncode, command, stderr=stderr)
+    finally:
+        # Reached early when the consumer stops iterating
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+def _to_block(data, np_dtype, channels):
+    block = np.frombuffer(data, dtype=np_dtype).astype(np_dtype.newbyteorder('='), copy=False)
+    return block if channels == 1 else block.reshape(-1, channels)
+
+
+def prefetched(make_iterator, prefetch=2):
+    """
+    Yield the items of make_iterator() while a background thread already
+    produces the next ones, at most prefetch of them waiting in memory.
+    Errors of the producer are raised in the consumer; stopping early stops
+    the producer and closes its iterator (killing ffmpeg for the streams here).
+    """
+    items = queue.Queue(maxsize=prefetch)
+    stop_event = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = make_iterator()
+        try:
+            for item in iterator:
+                if not put(item):
+                    break
+            else:
+                put(done)
+        except Exception as e:
+            put(e)
+        finally:
+            iterator.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop_event.set()
+        producer.join()
+
+
+def stream_audio_windows(source_path, sample_rate=16000, window_seconds=30, channels=1, dtype='float32', prefetch=2):
+    """
+    Yield the audio of source_path in fixed windows of window_seconds (the
+    last one shorter) while ffmpeg keeps decoding the next windows on a
+    background thread, see prefetched(). Fixed windows cut through words;
+    for ASR use editing.stream_speech_windows(), which ends them at silences.
+    """
+    return prefetched(lambda: stream_audio_blocks(source_path, sample_rate, channels,
+                                                  block_size=int(sample_rate * window_seconds), dtype=dtype),
+                      prefetch)
+
+
+def read_audio(source_path, sample_rate=16000, channels=1, dtype='float32'):
+    """
+    Decode the whole audio track of source_path into one NumPy array,
+    without writing an intermediate WAV. float32 by default, which is what
+    the Whisper and wav2vec2 processors expect. Use stream_audio_windows()
+    to start working before the whole file is decoded.
+    """
+    blocks = list(stream_audio_blocks(source_path, sample_rate, channels, block_size=sample_rate * 30, dtype=dtype))
+    if not blocks:
+        shape = (0,) if channels == 1 else (0, channels)
+        return np.zeros(shape, dtype=dtype)
+    return np.concatenate(blocks)
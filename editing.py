@@ -1,7 +1,3 @@
-from pydub import AudioSegment, silence
-import os
-import subprocess
-import json
 """
 1. Split audio from video file.
 2. Check for silence of 0.5 seconds on the audio to determine when to cut
@@ -10,10 +6,19 @@ import json
 """
 
 import os
+import re
+import math
+import bisect
+from collections import deque
+import hashlib
+import tempfile
 import subprocess
 import json
-from pydub import AudioSegment
-from pydub.silence import detect_silence
+import wave
+
+import numpy as np
+
+from audio_stream import stream_audio_blocks, prefetched
 
 # Assume extract_audio function exists and works correctly:
 # def extract_audio(video_path, audio_path):
@@ -21,51 +26,358 @@ from pydub.silence import detect_silence
 #     cmd = ['ffmpeg', '-i', video_path, '-acodec', 'pcm_wav', audio_path]
 #     subprocess.run(cmd, check=True)
 
-def split_video_on_silence(video_path, output_dir, max_chunk_length=55000, min_silence_len=500, max_silence_len=1000, silence_thresh=-40):
-    """
-    Splits a video file into smaller chunks based on detected silence,
-    ensuring chunks are less than a maximum length.
+# Milliseconds of audio turned into per-ms energies at a time, bounds temporary memory
+ENERGY_CHUNK_MS = 60000
 
-    Args:
-        video_path (str): Path to the input video file.
-        output_dir (str): Directory to save the output video chunks.
-        max_chunk_length (int): Maximum duration of a video chunk in milliseconds
-                                (default: 55000 ms = 55 seconds).
-        min_silence_len (int): Minimum length of silence to consider a break in milliseconds
-                               (default: 500 ms).
-        max_silence_len (int): Maximum length of silence to consider a preferred break point
-                               (default: 1000 ms = 1 second).
-        silence_thresh (int): Silence threshold in dBFS (default: -40 dBFS).
+# Where keyframe indexes read with ffprobe are cached
+KEYFRAME_INDEX_DIR = "keyframe_index"
+
+def read_wav_samples(wav_path):
     """
-    base_name = os.path.basename(video_path).split(".")[0]
-    print(f" ------------------- Base name: {base_name}")
-    # Ensure directories exist
-    os.makedirs(output_dir, exist_ok=True)
+    Read a PCM WAV file into a NumPy array.
 
-    audio_folder = "full_length_extracted_audios"
-    # Extract audio for silence detection
-    temp_audio_path = f"{audio_folder}/{base_name}.wav"
-    print(f"\n\n ------------------- Extracting audio to {temp_audio_path}...")
+    Returns:
+        tuple: (samples, sample_rate) - samples has shape (frames, channels).
+    """
+    with wave.open(wav_path, 'rb') as wav:
+        sample_width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+
+    dtypes = {2: '<i2', 4: '<i4'}
+    if sample_width not in dtypes:
+        raise ValueError(f"Unsupported WAV sample width {sample_width * 8} bits in {wav_path}, expected 16 or 32")
+    samples = np.frombuffer(data, dtype=dtypes[sample_width])
+    return samples.reshape(-1, channels), sample_rate
+
+def audio_length_ms(frame_count, sample_rate):
+    """Length of the audio in milliseconds, rounded the same way as len(AudioSegment)"""
+    return round(1000 * (float(frame_count) / sample_rate))
+
+def ms_to_frame(ms, sample_rate):
+    """Frame index at a millisecond position, as pydub computes it when slicing"""
+    return (np.asarray(ms, dtype=np.float64) * (sample_rate / 1000.0)).astype(np.int64)
+
+def energy_per_ms(samples, sample_rate, total_ms):
+    """
+    Sum of squared samples (over all channels) inside each millisecond of audio.
+    Milliseconds past the end of the data count as silence.
 
-    # Load audio with pydub
-    try:
-        audio = AudioSegment.from_wav(temp_audio_path)
-        print(f"Audio loaded, duration: {len(audio)} ms")
-    except Exception as e:
-        print(f"Error loading audio file {temp_audio_path}: {e}")# Clean up temp file
-        return
+    Returns:
+        np.ndarray: total_ms values (int64 for 8/16-bit input, float64 otherwise).
+    """
+    samples = samples.reshape(samples.shape[0], -1)
+    # int64 keeps 16-bit energies exact; wider samples would overflow it, accumulate those in
+    # float64 like audioop does
+    exact = np.issubdtype(samples.dtype, np.integer) and samples.dtype.itemsize <= 2
+    acc_dtype = np.int64 if exact else np.float64
+    boundaries = np.minimum(ms_to_frame(np.arange(total_ms + 1), sample_rate), samples.shape[0])
+    energies = np.zeros(total_ms, dtype=acc_dtype)
+
+    for chunk_start in range(0, total_ms, ENERGY_CHUNK_MS):
+        chunk_end = min(chunk_start + ENERGY_CHUNK_MS, total_ms)
+        first_frame = boundaries[chunk_start]
+        block = samples[first_frame:boundaries[chunk_end]].astype(acc_dtype)
+        cumulative = np.concatenate(([0], np.cumsum((block * block).sum(axis=1))))
+        ends = boundaries[chunk_start + 1:chunk_end + 1] - first_frame
+        starts = boundaries[chunk_start:chunk_end] - first_frame
+        energies[chunk_start:chunk_end] = cumulative[ends] - cumulative[starts]
+    return energies
+
+def merge_silent_starts(silence_starts, min_silence_len, seek_step=1):
+    """
+    Combine the start positions of silent windows into [start_ms, stop_ms]
+    ranges, joining windows that overlap exactly like pydub does.
+    """
+    silence_starts = np.asarray(silence_starts, dtype=np.int64)
+    if silence_starts.size == 0:
+        return []
+    gaps = np.diff(silence_starts)
+    breaks = np.flatnonzero((gaps != seek_step) & (gaps > min_silence_len))
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[breaks + 1]))
+    range_stops = np.concatenate((silence_starts[breaks], [silence_starts[-1]])) + min_silence_len
+    return [[int(start), int(stop)] for start, stop in zip(range_starts, range_stops)]
+
+def detect_silence_numpy(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """
+    Vectorized replacement for pydub.silence.detect_silence.
 
-    # Detect silent chunks longer than min_silence_len
-    print(f"Detecting silence with threshold {silence_thresh} dBFS and min length {min_silence_len} ms...")
-    # pydub's detect_silence already filters by min_silence_len
-    silence_ranges = detect_silence(audio, min_silence_len=min_silence_len, silence_thresh=silence_thresh)
+    The RMS of every min_silence_len window (one starting every seek_step ms)
+    is computed from a running sum of per-millisecond energies, and runs of
+    windows below the threshold are merged into ranges. Gives the same
+    [start_ms, stop_ms] ranges as pydub on the same audio.
 
-    print(f"Detected silence ranges (ms): {silence_ranges}")
+    Args:
+        samples (np.ndarray): Audio samples, shape (frames,) or (frames, channels).
+            Integer samples are full-scale at their dtype's range, float samples at 1.0.
+        sample_rate (int): Sample rate in Hz.
+        min_silence_len (int): Minimum length of a silence in milliseconds.
+        silence_thresh (float): Silence threshold in dBFS.
+        seek_step (int): Step between analysed windows in milliseconds.
+
+    Returns:
+        list: [start_ms, stop_ms] pairs of silent ranges.
+    """
+    samples = samples.reshape(samples.shape[0], -1)
+    channels = samples.shape[1]
+    total_ms = audio_length_ms(samples.shape[0], sample_rate)
+
+    # you can't have a silent portion of a sound that is longer than the sound
+    if total_ms < min_silence_len:
+        return []
+
+    is_float = np.issubdtype(samples.dtype, np.floating)
+    max_possible_amplitude = 1.0 if is_float else 2 ** (samples.dtype.itemsize * 8) / 2
+    threshold = 10 ** (float(silence_thresh) / 20) * max_possible_amplitude
+
+    last_slice_start = total_ms - min_silence_len
+    window_starts = np.arange(0, last_slice_start + 1, seek_step)
+    if last_slice_start % seek_step:
+        window_starts = np.append(window_starts, last_slice_start)
+
+    energies = energy_per_ms(samples, sample_rate, total_ms)
+    cumulative = np.concatenate(([0], np.cumsum(energies)))
+    window_energy = cumulative[window_starts + min_silence_len] - cumulative[window_starts]
+    # Padded frames past the end count towards the sample total, as in pydub
+    window_samples = (ms_to_frame(window_starts + min_silence_len, sample_rate)
+                      - ms_to_frame(window_starts, sample_rate)) * channels
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rms = np.sqrt(window_energy.astype(np.float64) / window_samples)
+    rms = np.nan_to_num(rms)
+    if not is_float:
+        rms = np.floor(rms)  # audioop.rms returns an integer
+
+    return merge_silent_starts(window_starts[rms <= threshold], min_silence_len, seek_step)
+
+class StreamingSilenceDetector:
+    """
+    Incremental version of detect_silence_numpy for audio of any length.
+
+    Feed consecutive blocks of samples with feed(); every silent range that
+    can no longer grow is returned as soon as it is known. finish() returns
+    the rest. Only the last min_silence_len milliseconds of energies are
+    kept, so memory use does not depend on the length of the recording.
+    The ranges are identical to detect_silence_numpy on the whole signal
+    (for sample rates of at least 1 kHz).
+    """
 
-    # --- Logic to determine cut points based on silence and max chunk length ---
-    cuts = [0] # Start at the beginning
+    def __init__(self, sample_rate, channels=1, min_silence_len=1000, silence_thresh=-16, seek_step=1,
+                 sample_width=2):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.min_silence_len = min_silence_len
+        self.seek_step = seek_step
+        self.sample_width = sample_width
+        self.threshold = 10 ** (float(silence_thresh) / 20) * 2 ** (sample_width * 8) / 2
+        self.acc_dtype = np.int64 if sample_width <= 2 else np.float64
+
+        self.frames_seen = 0
+        self.next_ms = 0            # first millisecond whose energy is not complete yet
+        self.partial_energy = 0     # energy of next_ms accumulated so far
+        self.cumulative = np.zeros(1, dtype=self.acc_dtype)  # running energy sum from cumulative_base ms
+        self.cumulative_base = 0
+        self.next_window = 0        # next window start to evaluate
+        self.range_start = None     # open silent range
+        self.prev_start = None
+        self.total_ms = None
+
+    def feed(self, block):
+        """Add the next block of integer samples, shape (frames,) or (frames, channels)"""
+        block = np.asarray(block).reshape(-1, self.channels)
+        first_frame = self.frames_seen
+        self.frames_seen += block.shape[0]
+
+        # Last millisecond boundary inside the data seen so far
+        completed_ms = int(self.frames_seen * 1000 // self.sample_rate) + 1
+        while ms_to_frame(completed_ms, self.sample_rate) > self.frames_seen:
+            completed_ms -= 1
+
+        squares = block.astype(self.acc_dtype)
+        squares = np.concatenate(([0], np.cumsum((squares * squares).sum(axis=1))))
+        edges = np.clip(ms_to_frame(np.arange(self.next_ms, completed_ms + 1), self.sample_rate) - first_frame,
+                        0, block.shape[0])
+        energies = squares[edges[1:]] - squares[edges[:-1]]
+        if energies.size:
+            energies[0] += self.partial_energy
+            self.partial_energy = squares[-1] - squares[edges[-1]]
+        else:
+            self.partial_energy += squares[-1] - squares[edges[-1]]
+        self.next_ms = max(self.next_ms, completed_ms)
+        self._append_energies(energies)
+
+        # Stay one millisecond behind: the final length is only known in finish()
+        return self._evaluate_windows(self.next_ms - self.min_silence_len - 1)
+
+    def finish(self):
+        """Flush the end of the audio and return the remaining silent ranges"""
+        self.total_ms = audio_length_ms(self.frames_seen, self.sample_rate)
+        if self.total_ms < self.min_silence_len:
+            return []
+
+        # Remaining milliseconds, past the end of the data they are zero padded like pydub does
+        if self.total_ms > self.next_ms:
+            energies = np.zeros(self.total_ms - self.next_ms, dtype=self.acc_dtype)
+            energies[0] = self.partial_energy
+            self._append_energies(energies)
+            self.next_ms = self.total_ms
+
+        last_slice_start = self.total_ms - self.min_silence_len
+        ranges = self._evaluate_windows(last_slice_start)
+        if last_slice_start % self.seek_step:
+            ranges += self._merge(self._silent_starts(np.array([last_slice_start])))
+
+        if self.range_start is not None:
+            ranges.append([int(self.range_start), int(self.prev_start + self.min_silence_len)])
+            self.range_start = self.prev_start = None
+        return ranges
+
+    def process(self, blocks):
+        """Generator over the silent ranges of an iterable of blocks; total_ms is set once it is exhausted"""
+        for block in blocks:
+            yield from self.feed(block)
+        yield from self.finish()
+
+    def open_range(self):
+        """
+        The silent range that has started but is not returned yet, as far as it
+        is known to be silent so far ([start, stop] in ms, it may still grow),
+        or None. A range is only returned once the next silence begins.
+        """
+        if self.range_start is None:
+            return None
+        return [int(self.range_start), int(self.prev_start + self.min_silence_len)]
+
+    def _append_energies(self, energies):
+        if energies.size:
+            self.cumulative = np.concatenate((self.cumulative, self.cumulative[-1] + np.cumsum(energies)))
+
+    def _silent_starts(self, window_starts):
+        offsets = window_starts - self.cumulative_base
+        window_energy = self.cumulative[offsets + self.min_silence_len] - self.cumulative[offsets]
+        window_samples = (ms_to_frame(window_starts + self.min_silence_len, self.sample_rate)
+                          - ms_to_frame(window_starts, self.sample_rate)) * self.channels
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rms = np.floor(np.nan_to_num(np.sqrt(window_energy.astype(np.float64) / window_samples)))
+        return window_starts[rms <= self.threshold]
+
+    def _evaluate_windows(self, last_start):
+        if last_start < self.next_window:
+            return []
+        window_starts = np.arange(self.next_window, last_start + 1, self.seek_step)
+        self.next_window = int(window_starts[-1]) + self.seek_step
+        ranges = self._merge(self._silent_starts(window_starts))
+
+        # Drop energies no later window can need (finish() may still look one step back)
+        keep_from = min(self.next_window - self.seek_step, self.next_ms) - self.cumulative_base
+        if keep_from > 0:
+            self.cumulative = self.cumulative[keep_from:]
+            self.cumulative_base += keep_from
+        return ranges
+
+    def _merge(self, silence_starts):
+        """merge_silent_starts with the open range carried between calls"""
+        if silence_starts.size == 0:
+            return []
+        if self.range_start is None:
+            self.range_start = self.prev_start = silence_starts[0]
+        starts = np.concatenate(([self.prev_start], silence_starts))
+        gaps = np.diff(starts)
+        breaks = np.flatnonzero((gaps != self.seek_step) & (gaps > self.min_silence_len))
+        range_starts = np.concatenate(([self.range_start], starts[breaks + 1]))
+        range_stops = np.concatenate((starts[breaks], [starts[-1]])) + self.min_silence_len
+        self.range_start = range_starts[-1]
+        self.prev_start = starts[-1]
+        return [[int(start), int(stop)] for start, stop in zip(range_starts[:-1], range_stops[:-1])]
+
+def iter_speech_windows(blocks, sample_rate, max_window_length=30000, min_silence_len=300, silence_thresh=-40,
+                        seek_step=10):
+    """
+    Regroup consecutive blocks of mono int16 samples into windows of at most
+    max_window_length ms that end in the middle of a silence, so an ASR model
+    fed window by window never sees a word cut in two. Each window ends at the
+    latest silence (StreamingSilenceDetector with min_silence_len,
+    silence_thresh and seek_step) that fits in it; a window without any
+    silence is cut at max_window_length. Only the current window is buffered.
+    """
+    detector = StreamingSilenceDetector(sample_rate, min_silence_len=min_silence_len,
+                                        silence_thresh=silence_thresh, seek_step=seek_step)
+    max_frames = int(ms_to_frame(max_window_length, sample_rate))
+    cut_points = deque()  # frame positions in the middle of the silences found so far
+    buffer = np.zeros(0, dtype=np.int16)
+    start = 0             # frame position of buffer[0]
+
+    for block in blocks:
+        for silence_start, silence_stop in detector.feed(block):
+            cut_points.append(int(ms_to_frame((silence_start + silence_stop) // 2, sample_rate)))
+        buffer = np.concatenate((buffer, np.asarray(block).reshape(-1)))
+        while len(buffer) >= max_frames:
+            limit = start + max_frames
+            cut = start
+            while cut_points and cut_points[0] <= limit:
+                cut = max(cut, cut_points.popleft())
+            # The latest silence is only returned by the detector once the next one begins
+            current = detector.open_range()
+            if current is not None:
+                candidate = int(ms_to_frame((current[0] + current[1]) // 2, sample_rate))
+                if candidate <= limit:
+                    cut = max(cut, candidate)
+            if cut == start:
+                # No silence in the whole window
+                cut = limit
+            yield buffer[:cut - start]
+            buffer = buffer[cut - start:]
+            start = cut
+    if len(buffer):
+        yield buffer
+
+def stream_speech_windows(source_path, sample_rate=16000, max_window_length=30000, min_silence_len=300,
+                          silence_thresh=-40, prefetch=2):
+    """
+    Decode source_path with ffmpeg and yield float32 windows for an ASR model
+    (see iter_speech_windows) while the next ones are decoded and split on a
+    background thread. Samples are decoded as int16 for the silence detection
+    and scaled to [-1.0, 1.0), the same values ffmpeg's float output has.
+    """
+    def windows():
+        blocks = stream_audio_blocks(source_path, sample_rate, block_size=sample_rate, dtype='int16')
+        try:
+            for window in iter_speech_windows(blocks, sample_rate, max_window_length, min_silence_len,
+                                              silence_thresh):
+                yield window.astype(np.float32) / 32768.0
+        finally:
+            blocks.close()
+
+    return prefetched(windows, prefetch)
+
+def read_wav_info(wav_path):
+    """Return (sample_rate, channels, sample_width) of a PCM WAV file"""
+    with wave.open(wav_path, 'rb') as wav:
+        return wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+
+def iter_wav_blocks(wav_path, block_frames=16000 * 10):
+    """Yield consecutive blocks of a PCM WAV file as (frames, channels) arrays without loading it whole"""
+    with wave.open(wav_path, 'rb') as wav:
+        sample_width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        dtypes = {2: '<i2', 4: '<i4'}
+        if sample_width not in dtypes:
+            raise ValueError(f"Unsupported WAV sample width {sample_width * 8} bits in {wav_path}, expected 16 or 32")
+        while True:
+            data = wav.readframes(block_frames)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=dtypes[sample_width]).reshape(-1, channels)
+
+def iter_greedy_cuts(silence_ranges, max_chunk_length=55000, min_silence_len=500, max_silence_len=1000):
+    """
+    Choose cut points (ms) from silence ranges as they arrive: cut at the end of
+    every suitable silence, and force a cut at max_chunk_length when a segment
+    would grow too long. Works on a generator, so cuts are known as soon as
+    the silence that decides them has been detected. Yields cut points after 0.
+    """
     last_cut_time = 0
-    audio_length = len(audio)
 
     for s_start, s_stop in silence_ranges:
         silence_duration = s_stop - s_start
@@ -79,32 +391,33 @@ def split_video_on_silence(video_path, output_dir, max_chunk_length=55000, min_s
 
         # If it's a suitable silence AND cutting here keeps the segment within max length, use it
         if is_suitable_silence and is_within_max_length:
-            cuts.append(s_stop)
             last_cut_time = s_stop
             print(f"Adding cut at end of suitable silence: {s_stop} ms")
+            yield s_stop
         elif time_since_last_cut > max_chunk_length:
              # The segment leading up to *this* silence is already too long.
              # We need to force a cut *before* this silence.
              # The forced cut point is max_chunk_length from the last cut.
              forced_cut_point = last_cut_time + max_chunk_length
 
-             # Ensure the forced cut point doesn't go past the start of the *current* silence
-             # This handles cases where max_chunk_length might land inside the silence
-             # We prefer cutting just before the silence starts if the forced point is beyond s_start
-             # But more simply, if the segment up to s_stop is too long, we must cut at max_chunk_length from last_cut_time
-             # Let's add the forced cut point.
-             if forced_cut_point > last_cut_time and forced_cut_point < audio_length: # Avoid adding duplicate cuts or cuts past the end
-                 cuts.append(forced_cut_point)
+             # The forced cut always lands before s_stop (and so before the end of the
+             # audio), because the segment up to s_stop is longer than max_chunk_length.
+             if forced_cut_point > last_cut_time: # Avoid adding duplicate cuts
                  last_cut_time = forced_cut_point
                  print(f"Forcing cut at max length: {forced_cut_point} ms")
+                 yield forced_cut_point
 
                  # After forcing a cut, check if the *current* silence is now viable for the *next* cut
                  # from the *new* last_cut_time.
                  time_since_new_last_cut = s_stop - last_cut_time
                  if is_suitable_silence and time_since_new_last_cut <= max_chunk_length:
-                      cuts.append(s_stop)
                       last_cut_time = s_stop
                       print(f"Adding cut at suitable silence after forced cut: {s_stop} ms")
+                      yield s_stop
+
+def finalize_cuts(cuts, audio_length, max_chunk_length=55000):
+    """Split an over-long remainder, close the list at audio_length and drop repeated cut points"""
+    cuts = list(cuts)
 
     # --- NEW LOGIC TO HANDLE REMAINDER ---
     # After the main silence processing loop, ensure that the segment from the
@@ -135,114 +448,527 @@ def split_video_on_silence(video_path, output_dir, max_chunk_length=55000, min_s
     for cut in cuts[1:]:
         if cut > unique_cuts[-1]:
             unique_cuts.append(cut)
-    cuts = unique_cuts
+    return unique_cuts
+
+# Cost weights of plan_cuts_dp, all expressed in milliseconds of chunk-length deviation
+DP_SILENCE_WEIGHT = 10      # per ms a silence is shorter than max_silence_len
+DP_FORCED_CUT_COST = 30000  # a cut in the middle of speech
+
+def forced_cut_points(start, stop, max_chunk_length):
+    """Evenly spaced cut points that break (start, stop) into pieces no longer than max_chunk_length"""
+    pieces = -(-(stop - start) // max_chunk_length)
+    return [start + (i * (stop - start)) // pieces for i in range(1, pieces)]
+
+def plan_cuts_dp(silence_ranges, audio_length, max_chunk_length=55000, max_silence_len=1000,
+                 target_chunk_length=None, silence_weight=DP_SILENCE_WEIGHT, forced_cut_cost=DP_FORCED_CUT_COST):
+    """
+    Choose cut points (ms) as the cheapest path from 0 to audio_length over candidate cuts.
+
+    Every silence offers a candidate cut at its middle. A plan costs the sum of
+    |chunk length - target_chunk_length| over its chunks, plus silence_weight per
+    ms a chosen silence is shorter than max_silence_len, plus forced_cut_cost for
+    each cut in the middle of speech. Forced candidates are only added inside
+    stretches with no silence for longer than max_chunk_length, spread evenly.
+    No chunk is ever longer than max_chunk_length.
+
+    The absolute deviation splits into two linear pieces (chunks shorter and longer
+    than the target), and both ranges of predecessors slide forward monotonically,
+    so each piece is a sliding-window minimum kept in a deque. After sorting, the
+    whole plan costs O(n). Returns the cut list including 0 and audio_length.
+    """
+    if audio_length <= 0:
+        return [0]
+    if target_chunk_length is None:
+        target_chunk_length = max_chunk_length * 4 // 5
+
+    # Candidates as (position, cost of cutting there), sorted and deduplicated
+    candidates = {}
+    for s_start, s_stop in silence_ranges:
+        position = (s_start + s_stop) // 2
+        if 0 < position < audio_length:
+            cost = silence_weight * max(0, max_silence_len - (s_stop - s_start))
+            candidates[position] = min(cost, candidates.get(position, cost))
+    positions = [0] + sorted(candidates) + [audio_length]
+    costs = [0] + [candidates[p] for p in positions[1:-1]] + [0]
+
+    # Make sure every gap can be bridged by a chunk of at most max_chunk_length
+    nodes, node_costs = [0], [0]
+    for position, cost in zip(positions[1:], costs[1:]):
+        for forced in forced_cut_points(nodes[-1], position, max_chunk_length):
+            nodes.append(forced)
+            node_costs.append(forced_cut_cost)
+        nodes.append(position)
+        node_costs.append(cost)
+
+    best = [0] * len(nodes)
+    previous = [0] * len(nodes)
+    long_window = deque()   # predecessors giving chunks >= target, minimizing best[i] - nodes[i]
+    short_window = deque()  # predecessors giving chunks < target, minimizing best[i] + nodes[i]
+    lo = mid = 0
+    for j in range(1, len(nodes)):
+        i = j - 1
+        while short_window and best[short_window[-1]] + nodes[short_window[-1]] >= best[i] + nodes[i]:
+            short_window.pop()
+        short_window.append(i)
+
+        # Predecessor i has to satisfy nodes[j] - max_chunk_length <= nodes[i]
+        while nodes[lo] < nodes[j] - max_chunk_length:
+            lo += 1
+        # Chunks from predecessors before mid are at least target_chunk_length long
+        while mid < j and nodes[mid] <= nodes[j] - target_chunk_length:
+            while long_window and best[long_window[-1]] - nodes[long_window[-1]] >= best[mid] - nodes[mid]:
+                long_window.pop()
+            long_window.append(mid)
+            mid += 1
+        while long_window and long_window[0] < lo:
+            long_window.popleft()
+        while short_window and short_window[0] < max(lo, mid):
+            short_window.popleft()
+
+        options = []
+        if long_window:
+            i = long_window[0]
+            options.append((best[i] + nodes[j] - nodes[i] - target_chunk_length, i))
+        if short_window:
+            i = short_window[0]
+            options.append((best[i] + target_chunk_length - nodes[j] + nodes[i], i))
+        cost, previous[j] = min(options)
+        best[j] = cost + node_costs[j]
+
+    cuts = [len(nodes) - 1]
+    while cuts[-1] != 0:
+        cuts.append(previous[cuts[-1]])
+    cuts = [nodes[k] for k in reversed(cuts)]
+    print(f"DP planner: {len(nodes) - 2} candidate cut(s), chose {len(cuts) - 2}, plan cost {best[-1]}")
+    return cuts
+
+def split_video_on_silence(video_path, output_dir, max_chunk_length=55000, min_silence_len=500, max_silence_len=1000, silence_thresh=-40, streaming=False, exact_cuts=False, keyframe_tolerance=300, cut_planner="greedy"):
+    """
+    Splits a video file into smaller chunks based on detected silence,
+    ensuring chunks are less than a maximum length.
+
+    Args:
+        video_path (str): Path to the input video file.
+        output_dir (str): Directory to save the output video chunks.
+        max_chunk_length (int): Maximum duration of a video chunk in milliseconds
+                                (default: 55000 ms = 55 seconds).
+        min_silence_len (int): Minimum length of silence to consider a break in milliseconds
+                               (default: 500 ms).
+        max_silence_len (int): Maximum length of silence to consider a preferred break point
+                               (default: 1000 ms = 1 second).
+        silence_thresh (int): Silence threshold in dBFS (default: -40 dBFS).
+        streaming (bool): Analyse the audio block by block with constant memory instead of
+                          loading it whole; falls back to an ffmpeg pipe from the video when
+                          the extracted WAV does not exist (default: False).
+        exact_cuts (bool): Re-encode so chunks start exactly at the cut points instead of
+                           copying streams and starting each chunk at the next keyframe
+                           (default: False).
+        keyframe_tolerance (int): How far (ms) a cut may be moved to land on a keyframe when
+                                  copying streams (default: 300 ms).
+        cut_planner (str): "greedy" cuts at every suitable silence as it is found; "dp" picks
+                           the cheapest set of cuts over all silences, keeping chunks near
+                           80% of max_chunk_length and avoiding cuts in the middle of speech
+                           (default: "greedy").
+    """
+    base_name = os.path.basename(video_path).split(".")[0]
+    print(f" ------------------- Base name: {base_name}")
+    # Ensure directories exist
+    os.makedirs(output_dir, exist_ok=True)
+
+    audio_folder = "full_length_extracted_audios"
+    # Extract audio for silence detection
+    temp_audio_path = f"{audio_folder}/{base_name}.wav"
+    print(f"\n\n ------------------- Extracting audio to {temp_audio_path}...")
+
+    if streaming:
+        # Constant memory: read fixed-size blocks and plan cuts while the audio is still being read
+        try:
+            if os.path.exists(temp_audio_path):
+                sample_rate, channels, sample_width = read_wav_info(temp_audio_path)
+                blocks = iter_wav_blocks(temp_audio_path, block_frames=sample_rate * 10)
+                print(f"Streaming audio from {temp_audio_path}")
+            else:
+                # No extracted WAV, decode the video's audio through an ffmpeg pipe instead
+                sample_rate, channels, sample_width = 16000, 1, 2
+                blocks = stream_audio_blocks(video_path, sample_rate=sample_rate, block_size=sample_rate * 10)
+                print(f"{temp_audio_path} not found, streaming audio from {video_path} through ffmpeg")
+        except Exception as e:
+            print(f"Error opening audio file {temp_audio_path}: {e}")
+            return
+
+        print(f"Detecting silence with threshold {silence_thresh} dBFS and min length {min_silence_len} ms...")
+        detector = StreamingSilenceDetector(sample_rate, channels, min_silence_len=min_silence_len,
+                                            silence_thresh=silence_thresh, sample_width=sample_width)
+        try:
+            if cut_planner == "dp":
+                # The DP needs every silence, but those are small even for hour-long audio
+                silence_ranges = list(detector.process(blocks))
+            else:
+                cuts = [0] + list(iter_greedy_cuts(detector.process(blocks), max_chunk_length,
+                                                   min_silence_len, max_silence_len))
+        except Exception as e:
+            print(f"Error reading audio for {video_path}: {e}")
+            return
+        audio_length = detector.total_ms
+        print(f"Audio streamed, duration: {audio_length} ms")
+    else:
+        # Load audio samples
+        try:
+            samples, sample_rate = read_wav_samples(temp_audio_path)
+            audio_length = audio_length_ms(samples.shape[0], sample_rate)
+            print(f"Audio loaded, duration: {audio_length} ms")
+        except Exception as e:
+            print(f"Error loading audio file {temp_audio_path}: {e}")# Clean up temp file
+            return
+
+        # Detect silent chunks longer than min_silence_len
+        print(f"Detecting silence with threshold {silence_thresh} dBFS and min length {min_silence_len} ms...")
+        # detect_silence_numpy already filters by min_silence_len
+        silence_ranges = detect_silence_numpy(samples, sample_rate, min_silence_len=min_silence_len, silence_thresh=silence_thresh)
+
+        print(f"Detected silence ranges (ms): {silence_ranges}")
+
+        # --- Logic to determine cut points based on silence and max chunk length ---
+        if cut_planner != "dp":
+            cuts = [0] + list(iter_greedy_cuts(silence_ranges, max_chunk_length, min_silence_len, max_silence_len))
+
+    if cut_planner == "dp":
+        cuts = plan_cuts_dp(silence_ranges, audio_length, max_chunk_length, max_silence_len)
+    cuts = finalize_cuts(cuts, audio_length, max_chunk_length)
 
     print(f"Final cutting timestamps (ms): {cuts}")
 
-    # Use ffmpeg directly to split the video
-    for i in range(len(cuts) - 1):
-        start_ms = cuts[i]
-        end_ms = cuts[i+1]
-        duration_ms = end_ms - start_ms
+    if exact_cuts:
+        # Split the whole video in a single re-encoding ffmpeg run
+        split_video_segments(video_path, cuts, output_dir, base_name, exact_cuts=True)
+    else:
+        # Copy streams, snapping cuts to keyframes and smart-cutting the rest
+        split_video_keyframe_aware(video_path, cuts, output_dir, base_name,
+                                   tolerance_ms=keyframe_tolerance, max_chunk_length=max_chunk_length)
+
+def build_segment_command(video_path, cuts, output_pattern, segment_list_path, exact_cuts=False):
+    """
+    Build one ffmpeg command that writes every chunk between consecutive cut
+    points (ms) with the segment muxer, so the input is read a single time.
+
+    With exact_cuts=False streams are copied and every chunk starts at the
+    first keyframe at or after its cut point. With exact_cuts=True the video is
+    re-encoded once with keyframes forced at the cut points, so chunks start
+    exactly where requested.
+    """
+    # Round down to the millisecond: the muxer cuts at the first keyframe at or after
+    # each time, so a cut that sits exactly on a keyframe must not be rounded past it
+    segment_times = ",".join(f"{math.floor(cut) / 1000.0:.3f}" for cut in cuts[1:-1])
+    command = ['ffmpeg', '-nostdin', '-i', video_path, '-map', '0']
+    if exact_cuts:
+        command += ['-c:v', 'libx264', '-c:a', 'aac', '-b:a', '192k']
+        if segment_times:
+            command += ['-force_key_frames', segment_times]
+    else:
+        command += ['-c', 'copy']
+    command += ['-t', f"{cuts[-1] / 1000.0:.3f}", '-f', 'segment', '-reset_timestamps', '1',
+                '-segment_start_number', '1', '-segment_list', segment_list_path, '-segment_list_type', 'csv']
+    if segment_times:
+        command += ['-segment_times', segment_times]
+    command += ['-y', output_pattern]
+    return command
+
+def read_segment_list(segment_list_path, output_dir):
+    """Parse the segment muxer's CSV list into (path, start_sec, end_sec) tuples"""
+    segments = []
+    with open(segment_list_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().rsplit(',', 2)
+            if len(parts) == 3:
+                segments.append((os.path.join(output_dir, parts[0]), float(parts[1]), float(parts[2])))
+    return segments
+
+def source_has_audio(video_path):
+    """Check once with ffprobe whether the source has an audio stream (None if it can't be probed)"""
+    try:
+        probe_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', video_path]
+        result = subprocess.run(probe_cmd, check=True, capture_output=True, text=True)
+        streams = json.loads(result.stdout)['streams']
+        return any(stream['codec_type'] == 'audio' for stream in streams)
+    except (subprocess.CalledProcessError, FileNotFoundError, json.JSONDecodeError) as probe_error:
+        print(f"Could not check audio stream of {video_path} using ffprobe: {probe_error}")
+        return None
+
+def remove_stale_chunks(output_dir, base_name):
+    """
+    Delete <base_name>_chunk_NNN.mp4 files left in output_dir by an earlier
+    run, so a rerun that makes fewer chunks leaves no extra ones behind.
+    """
+    pattern = re.compile(re.escape(base_name) + r"_chunk_\d{3,}\.mp4$")
+    removed = 0
+    for name in os.listdir(output_dir):
+        if pattern.match(name):
+            os.remove(os.path.join(output_dir, name))
+            removed += 1
+    if removed:
+        print(f"Removed {removed} chunk(s) of {base_name} left by an earlier run")
+    return removed
+
+def split_video_segments(video_path, cuts, output_dir, base_name, exact_cuts=False):
+    """
+    Write <base_name>_chunk_NNN.mp4 files for every pair of consecutive cut
+    points (ms) in one ffmpeg pass. Falls back to a single re-encoding pass if
+    copying the streams fails.
+
+    Returns:
+        list: (path, start_sec, end_sec) of each chunk as listed by the segment muxer
+              (times can include the encoder's B-frame delay), or [] on failure.
+    """
+    if len(cuts) < 2:
+        print("Nothing to split")
+        return []
 
-        if duration_ms <= 0:
-            print(f"Skipping zero or negative duration chunk at index {i}")
+    os.makedirs(output_dir, exist_ok=True)
+    output_pattern = os.path.join(output_dir, f"{base_name}_chunk_%03d.mp4")
+    segment_list_path = os.path.join(output_dir, f"{base_name}_segments.csv")
+
+    # Chunks always carry every source stream (-map 0), so one probe of the source
+    # replaces verifying each chunk
+    has_audio = source_has_audio(video_path)
+    if has_audio is False:
+        print(f"Warning: {video_path} has no audio stream, chunks will have none either!")
+
+    attempts = [True] if exact_cuts else [False, True]
+    for exact in attempts:
+        mode = "re-encoding with keyframes at the cut points" if exact else "copying streams (cuts snap to keyframes)"
+        # Also clears what a failed attempt wrote before the next one
+        remove_stale_chunks(output_dir, base_name)
+        print(f"Creating {len(cuts) - 1} chunks in one pass, {mode}...")
+        command = build_segment_command(video_path, cuts, output_pattern, segment_list_path, exact_cuts=exact)
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            print(f"Error creating chunks by {mode}: {e}")
+            print(f"Error output: {e.stderr}")
             continue
 
-        start_sec = start_ms / 1000.0
-        duration_sec = duration_ms / 1000.0
+        segments = read_segment_list(segment_list_path, output_dir)
+        for i, (out_path, start_sec, end_sec) in enumerate(segments, 1):
+            print(f"Created chunk {i}: {start_sec:.2f}s to {end_sec:.2f}s (duration: {end_sec - start_sec:.2f}s) -> {out_path}")
+        return segments
 
-        out_path = os.path.join(output_dir, f"{base_name}_chunk_{i+1:03d}.mp4")
-        print(f"Creating chunk {i+1}: {start_sec:.2f}s to {end_ms/1000.0:.2f}s (duration: {duration_sec:.2f}s)")
-
-        # Direct ffmpeg command for accurate splitting (-ss after -i)
-        # Using -c copy to avoid re-encoding where possible
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,       # Input file
-            '-ss', str(start_sec),   # Start time
-            '-t', str(duration_sec), # Duration
-            '-c:v', 'copy',          # Copy video stream
-            '-c:a', 'copy',          # Copy audio stream
-            '-map', '0',             # Include all streams from input
-            '-y',                    # Overwrite output files
-            out_path
-        ]
-
-        # Fallback if stream copying fails (e.g., problematic codecs)
-        # You might need to uncomment and adjust codecs if copy fails often
-        # cmd_fallback = [
-        #     'ffmpeg',
-        #     '-i', video_path,
-        #     '-ss', str(start_sec),
-        #     '-t', str(duration_sec),
-        #     '-c:v', 'libx264',
-        #     '-c:a', 'aac',
-        #     '-b:a', '192k',
-        #     '-map', '0',
-        #     '-y',
-        #     out_path
-        # ]
+    print(f"Fatal Error: Failed to split {video_path} into chunks")
+    return []
+
+
+def probe_keyframes(video_path):
+    """Return the presentation times (ms) of all video keyframes, read from packet flags with ffprobe"""
+    probe_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                 '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path]
+    result = subprocess.run(probe_cmd, check=True, capture_output=True, text=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) >= 2 and 'K' in parts[1] and parts[0] not in ('', 'N/A'):
+            keyframes.append(float(parts[0]) * 1000.0)
+    return sorted(keyframes)
+
+def read_keyframe_index(video_path, index_dir=KEYFRAME_INDEX_DIR):
+    """
+    Keyframe times (ms) of video_path, probed once and cached as JSON in
+    index_dir. The cache is reused while the file's size and mtime are unchanged.
+    """
+    path = os.path.abspath(video_path)
+    st = os.stat(path)
+    path_hash = hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]
+    index_path = os.path.join(index_dir, f"{os.path.splitext(os.path.basename(path))[0]}_{path_hash}.json")
 
+    if os.path.exists(index_path):
         try:
-            # Try copying streams first
-            print("Trying to copy streams...")
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            print(f"Successfully created {out_path} by copying streams.")
-
-            # Verify the output has audio (optional but good practice)
-            try:
-                probe_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', out_path]
-                result = subprocess.run(probe_cmd, check=True, capture_output=True, text=True)
-                streams = json.loads(result.stdout)['streams']
-
-                has_audio = any(stream['codec_type'] == 'audio' for stream in streams)
-                if has_audio:
-                    print(f"Verified {out_path} has audio stream.")
-                else:
-                    print(f"Warning: {out_path} has no audio stream!")
-            except (subprocess.CalledProcessError, FileNotFoundError, json.JSONDecodeError) as probe_error:
-                 print(f"Could not verify audio stream for {out_path} using ffprobe: {probe_error}")
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('size') == st.st_size and index.get('mtime_ns') == st.st_mtime_ns:
+                return index['keyframes']
+        except (json.JSONDecodeError, KeyError) as e:
+            print(f"Warning: ignoring unreadable keyframe index {index_path}: {e}")
+
+    keyframes = probe_keyframes(path)
+    os.makedirs(index_dir, exist_ok=True)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump({'video': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'keyframes': keyframes}, f)
+    return keyframes
+
+def plan_keyframe_cuts(cuts, keyframes, tolerance_ms=300, max_chunk_length=None):
+    """
+    Nudge interior cut points (ms) onto the nearest keyframe within tolerance_ms,
+    as long as cuts stay in order and no chunk grows past max_chunk_length.
+
+    Returns:
+        tuple: (planned_cuts, aligned) - aligned[i] tells whether chunk i starts
+               on a keyframe and can be stream-copied as is.
+    """
+    planned = [cuts[0]]
+    for i, cut in enumerate(cuts[1:-1], 1):
+        position = bisect.bisect_left(keyframes, cut)
+        candidates = [keyframes[j] for j in (position - 1, position) if 0 <= j < len(keyframes)]
+        nearest = min(candidates, key=lambda kf: abs(kf - cut)) if candidates else None
+        if nearest is not None and abs(nearest - cut) <= tolerance_ms and planned[-1] < nearest < cuts[i + 1]:
+            fits = max_chunk_length is None or (nearest - planned[-1] <= max_chunk_length
+                                                and cuts[i + 1] - nearest <= max_chunk_length)
+            if fits:
+                cut = nearest
+        planned.append(cut)
+    planned.append(cuts[-1])
+
+    keyframe_set = set(keyframes)
+    aligned = [i == 0 or cut in keyframe_set for i, cut in enumerate(planned[:-1])]
+    return planned, aligned
+
+# ffprobe H.264 profile names and the matching libx264 -profile:v values
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+    'High 10': 'high10',
+    'High 4:2:2': 'high422',
+    'High 4:4:4 Predictive': 'high444',
+}
+
+def probe_video_stream(video_path):
+    """Return codec_name, profile, level, pix_fmt and time_base of the first video stream, or {}"""
+    try:
+        probe_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                     '-show_entries', 'stream=codec_name,profile,level,pix_fmt,time_base', '-of', 'json', video_path]
+        result = subprocess.run(probe_cmd, check=True, capture_output=True, text=True)
+        return json.loads(result.stdout)['streams'][0]
+    except (subprocess.CalledProcessError, FileNotFoundError, json.JSONDecodeError, IndexError, KeyError):
+        return {}
+
+def matching_encoder_options(stream):
+    """
+    libx264 options that reproduce the source's profile, level and pixel
+    format, or None when one of them is unknown or cannot be matched.
+    """
+    profile = X264_PROFILES.get(stream.get('profile'))
+    level = stream.get('level')
+    pix_fmt = stream.get('pix_fmt')
+    if stream.get('codec_name') != 'h264' or not profile or not pix_fmt or not isinstance(level, int) or level <= 0:
+        return None
+    return ['-profile:v', profile, '-level:v', f"{level // 10}.{level % 10}", '-pix_fmt', pix_fmt]
+
+def track_timescale(stream):
+    """MP4 track timescale of the source video (the denominator of its time_base), or None"""
+    try:
+        numerator, denominator = (int(part) for part in stream.get('time_base', '').split('/'))
+    except ValueError:
+        return None
+    return denominator if numerator == 1 and denominator > 0 else None
+
+def copy_range_command(video_path, start_ms, end_ms, out_path, audio=True):
+    """ffmpeg command that stream-copies [start_ms, end_ms) starting from the keyframe at start_ms"""
+    # Seek just past the keyframe so input seeking lands on it rather than the one before
+    return ['ffmpeg', '-nostdin', '-ss', f"{math.ceil(start_ms) / 1000.0:.3f}", '-i', video_path,
+            '-t', f"{(end_ms - start_ms) / 1000.0:.3f}", '-map', '0'] + ([] if audio else ['-an']) + \
+           ['-c', 'copy', '-avoid_negative_ts', 'make_zero', '-y', out_path]
+
+def encode_range_command(video_path, start_ms, end_ms, out_path, encoder_options=None, audio=True):
+    """
+    ffmpeg command that re-encodes the video of [start_ms, end_ms) frame-accurately,
+    copying audio (or dropping it when audio is False)
+    """
+    command = ['ffmpeg', '-nostdin', '-ss', f"{start_ms / 1000.0:.3f}", '-i', video_path,
+               '-t', f"{(end_ms - start_ms) / 1000.0:.3f}", '-map', '0', '-c:v', 'libx264']
+    command += encoder_options or []
+    command += ['-c:a', 'copy'] if audio else ['-an']
+    return command + ['-y', out_path]
+
+def smart_cut_chunk(video_path, start_ms, end_ms, keyframes, out_path, stream=None):
+    """
+    Write the chunk [start_ms, end_ms) re-encoding only the GOP fragment
+    between start_ms and the next keyframe, then stream-copying the rest.
+
+    An MP4 holds a single set of H.264 parameters (avcC) for the whole track,
+    so the head is encoded with the source's profile, level and pixel format
+    and the chunk keeps the source's track timescale; the parts go through
+    MPEG-TS so the body's own parameter sets stay in-band. When these settings
+    cannot be read or matched (stream from probe_video_stream()), the whole
+    chunk is re-encoded instead. The audio of the chunk is cut once from the
+    source and encoded to AAC, so there is no gap or overlap at the splice.
+    """
+    stream = stream or {}
+    encoder_options = matching_encoder_options(stream)
+    position = bisect.bisect_left(keyframes, start_ms)
+    next_keyframe = keyframes[position] if position < len(keyframes) else None
+
+    if encoder_options is None or next_keyframe is None or next_keyframe >= end_ms:
+        # Parameters can't be matched, or no keyframe inside the chunk: re-encode all of it
+        subprocess.run(encode_range_command(video_path, start_ms, end_ms, out_path,
+                                            ['-pix_fmt', stream['pix_fmt']] if stream.get('pix_fmt') else None),
+                       check=True, capture_output=True, text=True)
+        return
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(out_path) or '.') as work_dir:
+        head_path = os.path.join(work_dir, "head.ts")
+        body_path = os.path.join(work_dir, "body.ts")
+        list_path = os.path.join(work_dir, "parts.txt")
+        subprocess.run(encode_range_command(video_path, start_ms, next_keyframe, head_path, encoder_options, audio=False),
+                       check=True, capture_output=True, text=True)
+        subprocess.run(copy_range_command(video_path, next_keyframe, end_ms, body_path, audio=False),
+                       check=True, capture_output=True, text=True)
+        with open(list_path, 'w', encoding='utf-8') as f:
+            f.write(f"file '{os.path.abspath(head_path)}'\nfile '{os.path.abspath(body_path)}'\n")
+        concat_cmd = ['ffmpeg', '-nostdin', '-f', 'concat', '-safe', '0', '-i', list_path,
+                      '-ss', f"{start_ms / 1000.0:.3f}", '-t', f"{(end_ms - start_ms) / 1000.0:.3f}", '-i', video_path,
+                      '-map', '0:v', '-map', '1:a?', '-c:v', 'copy', '-c:a', 'aac']
+        timescale = track_timescale(stream)
+        if timescale:
+            concat_cmd += ['-video_track_timescale', str(timescale)]
+        subprocess.run(concat_cmd + ['-y', out_path], check=True, capture_output=True, text=True)
+
+def split_video_keyframe_aware(video_path, cuts, output_dir, base_name, tolerance_ms=300, max_chunk_length=None):
+    """
+    Split video_path at cuts (ms) at stream-copy speed without broken chunk starts.
+
+    Cuts are first nudged onto keyframes (read once per video and cached).
+    If every chunk then starts on a keyframe, all chunks come from one segment
+    muxer run. Otherwise chunks that start on a keyframe are copied and only
+    the head fragment of the others is re-encoded (smart cut).
+    """
+    try:
+        keyframes = read_keyframe_index(video_path)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Could not read keyframes of {video_path}: {e}. Falling back to plain stream copy.")
+        return split_video_segments(video_path, cuts, output_dir, base_name)
+
+    planned, aligned = plan_keyframe_cuts(cuts, keyframes, tolerance_ms, max_chunk_length)
+    moved = sum(1 for before, after in zip(cuts, planned) if before != after)
+    print(f"Keyframe planner: {len(keyframes)} keyframes, moved {moved} cut(s) onto keyframes "
+          f"(tolerance {tolerance_ms} ms), {aligned.count(False)} chunk(s) need a smart cut")
+
+    if all(aligned):
+        return split_video_segments(video_path, planned, output_dir, base_name)
 
+    stream = probe_video_stream(video_path)
+    if stream.get('codec_name') != 'h264':
+        print(f"Smart cut needs an H.264 source (got {stream.get('codec_name')}), re-encoding once with exact cuts instead")
+        return split_video_segments(video_path, planned, output_dir, base_name, exact_cuts=True)
 
+    os.makedirs(output_dir, exist_ok=True)
+    remove_stale_chunks(output_dir, base_name)
+    segments = []
+    for i in range(len(planned) - 1):
+        start_ms, end_ms = planned[i], planned[i + 1]
+        out_path = os.path.join(output_dir, f"{base_name}_chunk_{i+1:03d}.mp4")
+        mode = "copy" if aligned[i] else "smart cut"
+        try:
+            if aligned[i]:
+                subprocess.run(copy_range_command(video_path, start_ms, end_ms, out_path),
+                               check=True, capture_output=True, text=True)
+            else:
+                smart_cut_chunk(video_path, start_ms, end_ms, keyframes, out_path, stream)
         except subprocess.CalledProcessError as e:
-            print(f"Error creating chunk {i+1} by copying streams: {e}")
-            print(f"Error output (copy attempt): {e.stderr}")
-            print("Retrying chunk creation with re-encoding...")
-
-            # Fallback to re-encoding if copying failed
-            cmd_fallback = [
-                'ffmpeg',
-                '-i', video_path,
-                '-ss', str(start_sec),
-                '-t', str(duration_sec),
-                '-c:v', 'libx264', # You can choose a suitable video codec
-                '-c:a', 'aac',     # AAC is a common audio codec
-                '-b:a', '192k',    # Audio bitrate
-                '-map', '0',       # Include all streams
-                '-y',
-                out_path
-            ]
-            try:
-                 subprocess.run(cmd_fallback, check=True, capture_output=True, text=True)
-                 print(f"Successfully created {out_path} using re-encoding.")
-                 # Verify audio stream again after fallback
-                 try:
-                    probe_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', out_path]
-                    result = subprocess.run(probe_cmd, check=True, capture_output=True, text=True)
-                    streams = json.loads(result.stdout)['streams']
-                    has_audio = any(stream['codec_type'] == 'audio' for stream in streams)
-                    if has_audio:
-                        print(f"Verified {out_path} has audio stream after re-encoding.")
-                    else:
-                        print(f"Warning: {out_path} has no audio stream after re-encoding!")
-                 except (subprocess.CalledProcessError, FileNotFoundError, json.JSONDecodeError) as probe_error:
-                    print(f"Could not verify audio stream for {out_path} using ffprobe after re-encoding: {probe_error}")
-
-            except subprocess.CalledProcessError as e_fallback:
-                 print(f"Fatal Error: Failed to create chunk {i+1} even with re-encoding: {e_fallback}")
-                 print(f"Error output (re-encoding attempt): {e_fallback.stderr}")
-                 continue # Continue to the next chunk
+            print(f"Error creating chunk {i+1} ({mode}): {e}")
+            print(f"Error output: {e.stderr}")
+            continue
+        print(f"Created chunk {i+1} ({mode}): {start_ms/1000.0:.2f}s to {end_ms/1000.0:.2f}s -> {out_path}")
+        segments.append((out_path, start_ms / 1000.0, end_ms / 1000.0))
+    return segments
 
 
 if __name__ == "__main__":
@@ -6,6 +6,10 @@ from pathlib import Path
 import argparse
 import sys
 
+# transcript_store lives in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from transcript_store import TranscriptStore
+
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(
@@ -105,6 +109,16 @@ else:
 print(f"Using tracking file: {callback_tracking_file}")
 print(f"Output files: {transcript_file}, {srt_file}")
 
+# Indexed view of the transcript file, opened on first use by get_transcripts()
+transcripts = None
+
+def get_transcripts():
+    """Open the transcript store once; only lines added since the last run are parsed"""
+    global transcripts
+    if transcripts is None:
+        transcripts = TranscriptStore(transcript_file)
+    return transcripts
+
 def load_tracking_data():
     """Load existing callback tracking and processed files"""
     pending_callbacks = {}
@@ -124,13 +138,7 @@ def load_tracking_data():
     # Cross-check with transcript file to ensure consistency
     if os.path.exists(transcript_file):
         try:
-            with open(transcript_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if ':' in line:
-                        filename = line.split(':', 1)[0].strip()
-                        if filename:  # Only add non-empty filenames
-                            processed_files.add(filename)
+            processed_files.update(filename for filename in get_transcripts().keys() if filename)
         except Exception as e:
             print(f"Warning: Error reading transcript file: {e}")
     
@@ -359,8 +367,7 @@ def save_results(callback_id, audio_filename):
     if txt_result:
         results['txt'] = txt_result
         # Append to transcript file
-        with open(transcript_file, 'a', encoding='utf-8') as f:
-            f.write(f"{audio_filename}:{txt_result}\n")
+        get_transcripts().append(audio_filename, txt_result)
         print(f"TXT transcription saved to: {transcript_file}")
     
     # Get SRT result
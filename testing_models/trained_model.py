@@ -1,12 +1,24 @@
 # Example code (specifics depend on the model)
 import torch
 import os
-import librosa
+import sys
+
+# editing lives in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from editing import stream_speech_windows
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
 
 # --- Configuration ---
 # Path to the folder containing your audio files
 AUDIO_FOLDER = "full_length_extracted_audio"
+# Audio or video files; audio is decoded in memory, so videos need no extraction step
+MEDIA_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.mp4', '.mov', '.mkv', '.webm')
+SAMPLE_RATE = 16000
+# Longest audio fed to the model at a time. Windows end in a silence of at least
+# MIN_SILENCE_MS so no word is cut in two, and each one is recognized while the
+# next one is decoded
+WINDOW_SECONDS = 20
+MIN_SILENCE_MS = 300
 # Output file name for transcriptions
 OUTPUT_FILE = "wav2vec2_transcription.txt"
 
@@ -25,24 +37,28 @@ def transcribe_audio_with_wav2vec2(audio_file_path, processor, model):
     Transcribes an audio file using a Wav2Vec2 ASR model.
     """
     try:
-        # Load audio with librosa (Wav2Vec2 expects 16kHz sampling rate)
-        audio, rate = librosa.load(audio_file_path, sr=16000)
-        
-        # Process audio
-        input_values = processor(audio, sampling_rate=rate, return_tensors="pt").input_values
-        
-        # Move to device if using GPU
-        if DEVICE != "cpu":
-            input_values = input_values.to(DEVICE)
-        
-        # Perform inference
-        with torch.no_grad():
-            logits = model(input_values).logits
-        
-        # Decode the prediction
-        predicted_ids = torch.argmax(logits, dim=-1)
-        transcription = processor.batch_decode(predicted_ids)[0]
+        # Decode straight from ffmpeg into memory (Wav2Vec2 expects 16kHz sampling rate)
+        # and recognize window by window, split at silences, while ffmpeg decodes ahead
+        rate = SAMPLE_RATE
+        texts = []
+        for audio in stream_speech_windows(audio_file_path, sample_rate=rate,
+                                           max_window_length=WINDOW_SECONDS * 1000, min_silence_len=MIN_SILENCE_MS):
+            # Process audio
+            input_values = processor(audio, sampling_rate=rate, return_tensors="pt").input_values
+            
+            # Move to device if using GPU
+            if DEVICE != "cpu":
+                input_values = input_values.to(DEVICE)
+            
+            # Perform inference
+            with torch.no_grad():
+                logits = model(input_values).logits
+            
+            # Decode the prediction
+            predicted_ids = torch.argmax(logits, dim=-1)
+            texts.append(processor.batch_decode(predicted_ids)[0].strip())
         
+        transcription = " ".join(text for text in texts if text)
         return transcription
     except Exception as e:
         print(f"Error transcribing {audio_file_path}: {e}")
@@ -67,10 +83,10 @@ def main():
 
     transcriptions = []
     
-    audio_files = [f for f in os.listdir(AUDIO_FOLDER) if f.lower().endswith(('.wav', '.mp3', '.flac', '.m4a'))] 
+    audio_files = [f for f in os.listdir(AUDIO_FOLDER) if f.lower().endswith(MEDIA_EXTENSIONS)] 
     
     if not audio_files:
-        print(f"No audio files found in '{AUDIO_FOLDER}'. Supported formats: .wav, .mp3, .flac, .m4a")
+        print(f"No audio files found in '{AUDIO_FOLDER}'. Supported formats: {', '.join(MEDIA_EXTENSIONS)}")
         return
 
     print(f"Starting transcription of {len(audio_files)} files from '{AUDIO_FOLDER}'...")
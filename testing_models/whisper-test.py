@@ -1,10 +1,23 @@
 from transformers import pipeline
 import os
+import sys
 import torch # Required for PyTorch backend
 
+# editing lives in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from editing import stream_speech_windows
+
 # --- Configuration ---
 # Path to the folder containing your audio files
 AUDIO_FOLDER = "full_length_extracted_audio"
+# Audio or video files; audio is decoded in memory, so videos need no extraction step
+MEDIA_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.mp4', '.mov', '.mkv', '.webm')
+SAMPLE_RATE = 16000
+# Longest audio transcribed at a time, Whisper's own input window. Windows end in
+# a silence of at least MIN_SILENCE_MS so no word is cut in two, and each one
+# is transcribed while the next one is decoded
+WINDOW_SECONDS = 30
+MIN_SILENCE_MS = 300
 # Output file name for transcriptions
 OUTPUT_FILE = "whisper_transcription_hf.txt"
 
@@ -23,10 +36,14 @@ def transcribe_audio_with_hf_whisper(audio_file_path, transcriber_pipeline):
     Transcribes an audio file using a Hugging Face Whisper ASR model.
     """
     try:
-        # Let the pipeline handle audio loading and preprocessing automatically
-        # This is more robust and handles various audio formats better
-        result = transcriber_pipeline(audio_file_path)
-        return result["text"]
+        # Decode straight from ffmpeg into memory (works on video files too, no temporary WAV)
+        # and transcribe window by window, split at silences, while ffmpeg decodes ahead
+        texts = []
+        for audio in stream_speech_windows(audio_file_path, sample_rate=SAMPLE_RATE,
+                                           max_window_length=WINDOW_SECONDS * 1000, min_silence_len=MIN_SILENCE_MS):
+            result = transcriber_pipeline({"raw": audio, "sampling_rate": SAMPLE_RATE})
+            texts.append(result["text"].strip())
+        return " ".join(text for text in texts if text)
     except Exception as e:
         print(f"Error transcribing {audio_file_path}: {e}")
         print(f"  This could be due to a corrupted audio file or unsupported format.")
@@ -51,10 +68,10 @@ def main():
 
     transcriptions = []
     
-    audio_files = [f for f in os.listdir(AUDIO_FOLDER) if f.lower().endswith(('.wav', '.mp3', '.flac', '.m4a'))] 
+    audio_files = [f for f in os.listdir(AUDIO_FOLDER) if f.lower().endswith(MEDIA_EXTENSIONS)] 
     
     if not audio_files:
-        print(f"No audio files found in '{AUDIO_FOLDER}'. Supported formats: .wav, .mp3, .flac, .m4a")
+        print(f"No audio files found in '{AUDIO_FOLDER}'. Supported formats: {', '.join(MEDIA_EXTENSIONS)}")
         return
 
     print(f"Starting transcription of {len(audio_files)} files from '{AUDIO_FOLDER}'...")
@@ -0,0 +1,79 @@
+"""Parity of editing.detect_silence_numpy with pydub.silence.detect_silence"""
+
+import os
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+# editing lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+with warnings.catch_warnings():
+    # pydub warns when no ffmpeg is on the PATH, which these tests do not need
+    warnings.simplefilter("ignore", RuntimeWarning)
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+    from editing import detect_silence_numpy
+
+
+def to_segment(samples, sample_rate):
+    samples = samples.reshape(samples.shape[0], -1)
+    return AudioSegment(data=samples.astype('<i2').tobytes(), sample_width=2,
+                        frame_rate=sample_rate, channels=samples.shape[1])
+
+
+def assert_parity(samples, sample_rate, min_silence_len, silence_thresh, seek_step):
+    expected = detect_silence(to_segment(samples, sample_rate), min_silence_len=min_silence_len,
+                              silence_thresh=silence_thresh, seek_step=seek_step)
+    got = detect_silence_numpy(samples, sample_rate, min_silence_len=min_silence_len,
+                               silence_thresh=silence_thresh, seek_step=seek_step)
+    assert [list(r) for r in got] == [list(r) for r in expected]
+
+
+def speech_like(rng, sample_rate, seconds, channels=1):
+    """Bursts of loud noise separated by quiet gaps of random length"""
+    frames = int(sample_rate * seconds)
+    samples = rng.normal(0, 30, size=(frames, channels))
+    position = 0
+    while position < frames:
+        length = int(rng.integers(sample_rate // 20, sample_rate))
+        if rng.random() < 0.5:
+            samples[position:position + length] += rng.normal(0, 8000, size=(min(length, frames - position), channels))
+        position += length + int(rng.integers(0, sample_rate // 2))
+    return np.clip(samples, -32768, 32767).astype(np.int16).reshape(frames, -1).squeeze()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_signals(seed):
+    rng = np.random.default_rng(seed)
+    sample_rate = int(rng.choice([8000, 16000, 22050, 44100]))
+    channels = int(rng.choice([1, 2]))
+    samples = speech_like(rng, sample_rate, float(rng.uniform(0.5, 6)), channels)
+    assert_parity(samples, sample_rate, min_silence_len=int(rng.choice([100, 250, 500, 1000])),
+                  silence_thresh=float(rng.choice([-50, -40, -30, -16])), seek_step=int(rng.choice([1, 3, 10])))
+
+
+@pytest.mark.parametrize("seek_step", [1, 7, 50])
+def test_all_silent(seek_step):
+    samples = np.zeros(16000 * 3, dtype=np.int16)
+    assert_parity(samples, 16000, 500, -40, seek_step)
+
+
+@pytest.mark.parametrize("seek_step", [1, 4, 33])
+def test_silence_at_both_ends(seek_step):
+    rng = np.random.default_rng(1)
+    samples = np.zeros(16000 * 4, dtype=np.int16)
+    samples[16000:48000] = rng.normal(0, 8000, 32000).astype(np.int16)
+    assert_parity(samples, 16000, 700, -40, seek_step)
+
+
+def test_no_silence():
+    rng = np.random.default_rng(2)
+    samples = np.clip(rng.normal(0, 8000, 16000 * 2), -32768, 32767).astype(np.int16)
+    assert_parity(samples, 16000, 300, -40, 1)
+
+
+def test_shorter_than_min_silence():
+    samples = np.zeros(8000, dtype=np.int16)
+    assert_parity(samples, 16000, 1000, -40, 1)
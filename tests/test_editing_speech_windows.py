@@ -0,0 +1,59 @@
+"""editing.iter_speech_windows ends ASR windows in silences"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# editing lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from editing import iter_speech_windows
+
+SAMPLE_RATE = 16000
+
+
+def words_and_pauses(rng, seconds):
+    """
+    Tone bursts ("words") separated by short gaps and, now and then (at
+    least every 8 s), a pause of 0.4-0.9 s
+    """
+    parts, words, position, last_pause = [], [], 0, 0
+    while position < SAMPLE_RATE * seconds:
+        length = int(rng.uniform(0.2, 1.5) * SAMPLE_RATE)
+        parts.append((8000 * np.sin(2 * np.pi * 220 * np.arange(length) / SAMPLE_RATE)).astype(np.int16))
+        words.append((position, position + length))
+        position += length
+        if rng.random() < 0.3 or position - last_pause > 8 * SAMPLE_RATE:
+            gap = int(rng.uniform(0.4, 0.9) * SAMPLE_RATE)
+            last_pause = position + gap
+        else:
+            gap = int(rng.uniform(0.05, 0.2) * SAMPLE_RATE)
+        parts.append(np.zeros(gap, dtype=np.int16))
+        position += gap
+    return np.concatenate(parts), words
+
+
+def blocks_of(samples, size):
+    return (samples[start:start + size] for start in range(0, len(samples), size))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_windows_end_in_pauses(seed):
+    samples, words = words_and_pauses(np.random.default_rng(seed), 120)
+    windows = list(iter_speech_windows(blocks_of(samples, SAMPLE_RATE // 2), SAMPLE_RATE, max_window_length=20000))
+
+    assert np.array_equal(np.concatenate(windows), samples)
+    assert max(len(window) for window in windows) <= 20 * SAMPLE_RATE
+    cuts = np.cumsum([len(window) for window in windows])[:-1]
+    assert not [cut for cut in cuts if any(start < cut < stop for start, stop in words)]
+
+
+def test_no_pause_is_cut_at_max_window():
+    tone = (8000 * np.sin(2 * np.pi * 220 * np.arange(SAMPLE_RATE * 25) / SAMPLE_RATE)).astype(np.int16)
+    windows = list(iter_speech_windows(blocks_of(tone, SAMPLE_RATE), SAMPLE_RATE, max_window_length=10000))
+    assert [len(window) for window in windows] == [10 * SAMPLE_RATE, 10 * SAMPLE_RATE, 5 * SAMPLE_RATE]
+
+
+def test_empty_input():
+    assert list(iter_speech_windows([], SAMPLE_RATE)) == []
@@ -0,0 +1,130 @@
+"""translations/translate.py against a local LibreTranslate-compatible endpoint"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# translate lives in translations/, its helpers in the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'translations'))
+import translate
+
+
+class FakeEndpoint:
+    """Reverses every line; a request containing BAD is refused with 400"""
+
+    def __init__(self):
+        self.requests = 0
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                endpoint.requests += 1
+                if 'BAD' in body['q']:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                text = '\n'.join(f"<{body['target']}>{line[::-1]}" for line in body['q'].split('\n'))
+                data = json.dumps({'translatedText': text}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/translate"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def endpoint(tmp_path, monkeypatch):
+    server = FakeEndpoint()
+    monkeypatch.setattr(translate, 'TRANSLATE_ENDPOINT', server.url)
+    monkeypatch.setattr(translate, 'TRANSLATE_PROVIDER', None)
+    monkeypatch.setattr(translate, 'TRANSLATION_MEMORY_PATH', str(tmp_path / 'memory.sqlite3'))
+    monkeypatch.setattr(translate, 'RETRY_BASE_DELAY', 0.0)
+    monkeypatch.setattr(translate, '_memory', None)
+    monkeypatch.setattr(translate, '_limiters', {})
+    yield server
+    server.close()
+    if translate._memory is not None:
+        translate._memory.close()
+
+
+def write_input(path, lines):
+    path.write_text(''.join(f"{video_id}: {text}\n" for video_id, text in lines), encoding='utf-8')
+    return str(path)
+
+
+def translate_to_english(input_file, output_file):
+    return translate.translate_file(input_file, 'en', 'English', output_file)
+
+
+def test_lines_are_batched(endpoint, tmp_path):
+    # 30 lines of 400 characters, 11 fit in a 4500 character batch
+    lines = [(f"video{i}", f"{i:03d}" + 'a' * 397) for i in range(30)]
+    input_file = write_input(tmp_path / 'in.txt', lines)
+    output_file = translate_to_english(input_file, str(tmp_path / 'out.txt'))
+
+    assert endpoint.requests == 3
+    with open(output_file, encoding='utf-8') as f:
+        assert f.read().splitlines() == [f"{video_id}:<en>{text[::-1]}" for video_id, text in lines]
+
+
+def test_bad_line_is_isolated_by_bisection(endpoint, tmp_path):
+    lines = [(f"video{i}", f"line {i}") for i in range(8)]
+    lines[5] = ('video5', 'BAD line')
+    input_file = write_input(tmp_path / 'in.txt', lines)
+    output_file = translate_to_english(input_file, str(tmp_path / 'out.txt'))
+
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1, no retries for a 400
+    assert endpoint.requests == 7
+    with open(output_file, encoding='utf-8') as f:
+        output = f.read().splitlines()
+    assert output[5] == 'video5: BAD line'
+    assert output[:5] + output[6:] == [f"{video_id}:<en>{text[::-1]}" for video_id, text in lines if video_id != 'video5']
+
+
+def test_rerun_resumes_from_progress_and_memory(endpoint, tmp_path, monkeypatch):
+    lines = [(f"video{i}", f"line {i}") for i in range(10)]
+    input_file = write_input(tmp_path / 'in.txt', lines)
+    output_file = str(tmp_path / 'out.txt')
+    translate_to_english(input_file, output_file)
+    with open(output_file, encoding='utf-8') as f:
+        first_output = f.read()
+    requests_sent = endpoint.requests
+
+    # Nothing changed: everything comes from the progress log
+    translate_to_english(input_file, output_file)
+    assert endpoint.requests == requests_sent
+
+    # One line changed: only that line is sent again
+    lines[3] = ('video3', 'line three')
+    write_input(tmp_path / 'in.txt', lines)
+    translate_to_english(input_file, output_file)
+    assert endpoint.requests == requests_sent + 1
+
+    # The same service on another port keeps the memory, even without a progress log
+    moved = FakeEndpoint()
+    try:
+        monkeypatch.setattr(translate, 'TRANSLATE_ENDPOINT', moved.url)
+        os.remove(output_file + translate.PROGRESS_SUFFIX)
+        translate_to_english(input_file, output_file)
+        assert moved.requests == 0
+    finally:
+        moved.close()
+    with open(output_file, encoding='utf-8') as f:
+        assert f.read() == first_output.replace('3 enil', 'eerht enil')
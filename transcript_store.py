@@ -0,0 +1,296 @@
+"""
+Indexed, append-only store for `video_id:text` transcript files.
+
+The transcript file itself stays the log: plain UTF-8, one `video_id:text`
+line per entry, readable by every existing script. Next to it a small SQLite
+index (`<file>.index.sqlite3`) maps every video_id to the byte offset and
+length of its latest line, so a lookup is one index query plus one seek, and
+reopening a file only parses the bytes appended since the last time it was
+indexed. Startup cost stays flat however large the corpus grows.
+
+As with a dict built from the file, a video_id that appears on several lines
+takes the text of the last one and keeps the position of the first one.
+
+The file must only ever be appended to while it has an index. Replacing it,
+truncating it, rewriting it in place at the same size or editing the bytes
+just before the indexed end is noticed and triggers a full re-index; an edit
+further back in a file that has also grown is not, so delete the index after
+editing a transcript file by hand.
+"""
+
+import os
+import sqlite3
+import hashlib
+import threading
+
+# Bump when the index layout changes, forces a full re-index
+INDEX_VERSION = 1
+
+INDEX_SUFFIX = ".index.sqlite3"
+
+# Bytes before the indexed end that are hashed to notice a rewritten file
+TAIL_CHECK_BYTES = 4096
+
+# Index rows written per executemany() while scanning
+INDEX_BATCH_SIZE = 10000
+
+
+def parse_transcript_line(line):
+    """Split a `video_id:text` line into (video_id, text), or None if it has no colon"""
+    line = line.strip()
+    if ':' not in line:
+        return None
+    # Split only on the first colon to handle colons in the text
+    video_id, text = line.split(':', 1)
+    return video_id.strip(), text.strip()
+
+
+def iter_transcript_file(path):
+    """Stream (video_id, text) pairs of a transcript file in file order, duplicates included"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = parse_transcript_line(line)
+            if entry:
+                yield entry
+
+
+class TranscriptStore:
+    """
+    Dict-like view of a transcript file with O(1) lookup by video_id,
+    streaming iteration and atomic appends. Safe to share between threads;
+    appends from several processes are safe too, each one is a single
+    O_APPEND write of a whole line.
+    """
+
+    def __init__(self, path, index_path=None, create=True):
+        self.path = path
+        if not os.path.exists(path):
+            if not create:
+                raise FileNotFoundError(f"Transcript file not found: {path}")
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'a', encoding='utf-8').close()
+
+        self.index_path = index_path or path + INDEX_SUFFIX
+        self._lock = threading.Lock()
+        self._identity = None
+        self._reader = None
+        self._reader_identity = None
+        try:
+            self._db = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._create_tables()
+        except sqlite3.OperationalError:
+            # Read-only folder: keep the index in memory for this run only
+            self.index_path = ":memory:"
+            self._db = sqlite3.connect(self.index_path, check_same_thread=False)
+            self._create_tables()
+        self.refresh()
+
+    def _create_tables(self):
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                video_id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_position ON entries (position);
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+            if self._reader:
+                self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- Indexing -------------------------------------------------------------
+
+    def _meta(self, key, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _tail_digest(self, f, end):
+        start = max(0, end - TAIL_CHECK_BYTES)
+        f.seek(start)
+        return hashlib.sha256(f.read(end - start)).hexdigest()
+
+    def refresh(self):
+        """
+        Index whatever was appended to the file since the last refresh. The
+        whole file is re-indexed only if it was replaced, truncated, modified
+        without growing or edited before the indexed end (see the module
+        docstring). Returns the number of lines indexed.
+        """
+        with self._lock:
+            st = os.stat(self.path)
+            identity = self._identity = f"{st.st_dev}:{st.st_ino}"
+            with open(self.path, 'rb') as f:
+                indexed = self._meta('indexed_bytes', 0)
+                rewritten = indexed == st.st_size and self._meta('mtime_ns') != st.st_mtime_ns
+                if (self._meta('version') != INDEX_VERSION or self._meta('identity') != identity or rewritten
+                        or indexed > st.st_size or self._meta('tail_digest') != self._tail_digest(f, indexed)):
+                    self._db.execute("DELETE FROM entries")
+                    indexed = 0
+                    # The read handle may still buffer the old bytes
+                    self._reader_identity = None
+                if indexed == st.st_size:
+                    return 0
+                indexed, count = self._index_from(f, indexed)
+                self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                    ('version', INDEX_VERSION),
+                    ('identity', identity),
+                    ('indexed_bytes', indexed),
+                    ('tail_digest', self._tail_digest(f, indexed)),
+                    ('mtime_ns', st.st_mtime_ns),
+                ])
+            self._db.commit()
+        return count
+
+    def _index_from(self, f, offset):
+        """Index complete lines from offset to the end of f, returns (indexed end, lines)"""
+        f.seek(offset)
+        batch = []
+        count = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                # Unterminated last line, maybe still being written: index it
+                # but parse it again on the next refresh
+                entry = parse_transcript_line(line.decode('utf-8', errors='replace'))
+                if entry:
+                    batch.append((entry[0], offset, offset, len(line)))
+                break
+            entry = parse_transcript_line(line.decode('utf-8', errors='replace'))
+            if entry:
+                batch.append((entry[0], offset, offset, len(line)))
+                count += 1
+            offset += len(line)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                self._write_index(batch)
+                batch = []
+        self._write_index(batch)
+        return offset, count
+
+    def _write_index(self, batch):
+        # A repeated video_id keeps its first position and points to its latest line
+        self._db.executemany("""
+            INSERT INTO entries (video_id, position, offset, length) VALUES (?, ?, ?, ?)
+            ON CONFLICT (video_id) DO UPDATE SET offset = excluded.offset, length = excluded.length
+        """, batch)
+
+    # --- Reading --------------------------------------------------------------
+
+    def _read_text(self, offset, length):
+        # Called with the lock held; the handle is reopened after refresh() saw a new file
+        if self._reader_identity != self._identity:
+            if self._reader:
+                self._reader.close()
+            self._reader = open(self.path, 'rb')
+            self._reader_identity = self._identity
+        self._reader.seek(offset)
+        entry = parse_transcript_line(self._reader.read(length).decode('utf-8', errors='replace'))
+        return entry[1] if entry else ''
+
+    def get(self, video_id, default=None):
+        """Latest text of video_id, or default"""
+        with self._lock:
+            row = self._db.execute("SELECT offset, length FROM entries WHERE video_id = ?", (video_id,)).fetchone()
+            if row is None:
+                return default
+            return self._read_text(*row)
+
+    def __getitem__(self, video_id):
+        text = self.get(video_id)
+        if text is None:
+            raise KeyError(video_id)
+        return text
+
+    def __contains__(self, video_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM entries WHERE video_id = ?", (video_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _rows(self, read_text=False):
+        """Stream (video_id, text or None) in file order without loading the whole index"""
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT position, video_id, offset, length FROM entries WHERE position > ? "
+                    "ORDER BY position LIMIT ?", (last, INDEX_BATCH_SIZE)
+                ).fetchall()
+                if not rows:
+                    return
+                batch = [(video_id, self._read_text(offset, length) if read_text else None)
+                         for _, video_id, offset, length in rows]
+            yield from batch
+            last = rows[-1][0]
+
+    def keys(self):
+        """Stream the video_ids in the order they first appear in the file"""
+        for video_id, _ in self._rows():
+            yield video_id
+
+    __iter__ = keys
+
+    def items(self):
+        """Stream (video_id, latest text) pairs in the order the video_ids first appear"""
+        return self._rows(read_text=True)
+
+    def values(self):
+        for _, text in self.items():
+            yield text
+
+    def to_dict(self):
+        return dict(self.items())
+
+    # --- Writing --------------------------------------------------------------
+
+    def append(self, video_id, text):
+        """
+        Atomically append one entry to the file and index it. Line breaks in
+        text are folded into spaces so the entry stays on one line.
+        """
+        self.extend([(video_id, text)])
+
+    def extend(self, entries):
+        """Atomically append several (video_id, text) entries with a single write, see append()"""
+        data = b''.join(
+            f"{str(video_id).strip()}:{' '.join(str(text).splitlines()).strip()}\n".encode('utf-8')
+            for video_id, text in entries
+        )
+        if not data:
+            return
+
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # Never glue the new entries onto an unterminated last line
+                size = os.fstat(fd).st_size
+                if size:
+                    with open(self.path, 'rb') as f:
+                        f.seek(size - 1)
+                        if f.read(1) != b'\n':
+                            data = b'\n' + data
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.refresh()
+
+def open_transcripts(path):
+    """Open an existing transcript file as a TranscriptStore, raises FileNotFoundError if it is missing"""
+    return TranscriptStore(path, create=False)
@@ -0,0 +1,141 @@
+"""
+Persistent translation memory shared by the translation scripts.
+
+Every translation is stored in a small SQLite database under the key
+(normalized source text, source language, target language, provider), so
+reruns over unchanged transcripts and phrases repeated across files never go
+over the network twice. Normalization only folds Unicode forms and
+whitespace; anything that could change the meaning of the text (case,
+punctuation) is part of the key.
+
+The memory is trimmed least-recently-used first once it holds more than
+max_entries translations.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+# Next to the translation scripts whatever the working directory is
+DEFAULT_MEMORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translations",
+                                   "translation_memory.sqlite3")
+DEFAULT_MAX_ENTRIES = 500000
+
+# SQLite limits the number of parameters of one statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+def normalize_text(text):
+    """Canonical form of a source text: NFC with runs of whitespace folded to one space"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def memory_key(text, source_lang, target_lang, provider):
+    payload = '\x1f'.join((provider, source_lang, target_lang, normalize_text(text)))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """
+    On-disk (source text, src, tgt, provider) -> translation cache with LRU
+    eviction by entry count. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_MEMORY_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                source_text TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS translations_last_access ON translations (last_access);
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup_many(self, texts, source_lang, target_lang, provider):
+        """
+        Return {text: translation} for the texts already in memory, marking
+        them recently used. Texts that are not in memory are left out.
+        """
+        keys = {}
+        for text in texts:
+            keys.setdefault(memory_key(text, source_lang, target_lang, provider), []).append(text)
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            for start in range(0, len(key_list), LOOKUP_CHUNK_SIZE):
+                chunk = key_list[start:start + LOOKUP_CHUNK_SIZE]
+                rows = self._db.execute(
+                    f"SELECT key, translated_text FROM translations WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, translated_text in rows:
+                    for text in keys[key]:
+                        found[text] = translated_text
+                if rows:
+                    now = time.time()
+                    self._db.executemany("UPDATE translations SET last_access = ? WHERE key = ?",
+                                         [(now, key) for key, _ in rows])
+            self._db.commit()
+        return found
+
+    def lookup(self, text, source_lang, target_lang, provider):
+        """Translation of text from memory, or None"""
+        return self.lookup_many([text], source_lang, target_lang, provider).get(text)
+
+    def store_many(self, translations, source_lang, target_lang, provider):
+        """Remember {source text: translation} pairs and trim the memory"""
+        now = time.time()
+        rows = [(memory_key(text, source_lang, target_lang, provider), provider, source_lang, target_lang,
+                 normalize_text(text), translated_text, now, now)
+                for text, translated_text in translations.items()]
+        with self._lock:
+            self._db.executemany("""
+                INSERT OR REPLACE INTO translations
+                    (key, provider, source_lang, target_lang, source_text, translated_text, created, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            self._db.commit()
+        self.evict()
+
+    def store(self, text, translated_text, source_lang, target_lang, provider):
+        self.store_many({text: translated_text}, source_lang, target_lang, provider)
+
+    def evict(self):
+        """Remove least-recently-used translations until at most max_entries are left"""
+        with self._lock:
+            excess = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.max_entries
+            if excess <= 0:
+                return 0
+            self._db.execute("""
+                DELETE FROM translations WHERE key IN (
+                    SELECT key FROM translations ORDER BY last_access ASC LIMIT ?
+                )
+            """, (excess,))
+            self._db.commit()
+        return excess
@@ -1,5 +1,16 @@
 import os
-from deep_translator import GoogleTranslator
+import sys
+import time
+import hashlib
+import random
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# transcript_store lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from transcript_store import TranscriptStore
+from translation_memory import TranslationMemory, DEFAULT_MEMORY_PATH, normalize_text
 
 # Define target languages with their codes and file suffixes
 languages = {
@@ -14,66 +25,413 @@ languages = {
 # Input file to process
 input_file = 'neura/transcriptions_neura.txt'
 
-def translate_file(input_file, target_lang, lang_name):
+# Characters sent per request, Google Translate rejects texts over 5000
+MAX_BATCH_CHARS = 4500
+
+# Lines of a batch are joined with a line break, which the translators keep
+BATCH_DELIMITER = '\n'
+
+# LibreTranslate-compatible endpoint (e.g. http://localhost:5000/translate) used
+# instead of Google Translate when set, also handy for a local fake server
+TRANSLATE_ENDPOINT = os.environ.get('TRANSLATE_ENDPOINT')
+
+# Name of the provider behind TRANSLATE_ENDPOINT, keys the translation memory
+# and the progress digests so moving the same service to another host or port
+# keeps its translations. Defaults to 'libretranslate' ('google' without an
+# endpoint); give different services different names
+TRANSLATE_PROVIDER = os.environ.get('TRANSLATE_PROVIDER')
+
+# Finished lines of an output file are checkpointed in <output file>.progress,
+# one `video_id:digest translation` line each, so an interrupted or repeated
+# run only translates lines that are missing or whose source text changed.
+# It is compacted to the current input's lines when the output is written
+PROGRESS_SUFFIX = '.progress'
+
+# Lines read from the input and checkpointed at a time, bounds memory use
+CHUNK_SIZE = 500
+
+# Per provider: requests in flight at once and requests started per second,
+# shared by every language being translated
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_SECOND = 10.0
+
+# Failed requests are retried after RETRY_BASE_DELAY * 2**attempt seconds, jittered
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+
+class ProviderLimiter:
+    """Caps the requests in flight and the request rate of one translation provider"""
+
+    def __init__(self, max_concurrent=None, requests_per_second=None):
+        max_concurrent = max_concurrent or MAX_CONCURRENT_REQUESTS
+        requests_per_second = requests_per_second or REQUESTS_PER_SECOND
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+        time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._slots.release()
+
+# Translations already made are looked up here before anything is sent
+TRANSLATION_MEMORY_PATH = os.environ.get('TRANSLATION_MEMORY', DEFAULT_MEMORY_PATH)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_memory = None
+
+def provider_name():
+    """Name of the current provider, part of the translation memory key"""
+    if TRANSLATE_PROVIDER:
+        return TRANSLATE_PROVIDER
+    return 'libretranslate' if TRANSLATE_ENDPOINT else 'google'
+
+def translation_memory():
+    """The translation memory shared by every language of this process"""
+    global _memory
+    with _limiters_lock:
+        if _memory is None:
+            _memory = TranslationMemory(TRANSLATION_MEMORY_PATH)
+        return _memory
+
+def provider_limiter():
+    """The limiter shared by every translation going to the current provider"""
+    # Limits apply per server, so two hosts of the same provider get their own
+    provider = TRANSLATE_ENDPOINT or provider_name()
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderLimiter()
+        return _limiters[provider]
+
+def is_transient_error(error):
+    """
+    True for failures that can go away when the same request is sent again:
+    timeouts, connection errors, rate limiting (429) and server errors (5xx).
+    """
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    if type(error).__module__.startswith('deep_translator'):
+        # deep_translator reports rate limiting and failed HTTP requests with its own exceptions
+        from deep_translator.exceptions import TooManyRequests, RequestError
+        return isinstance(error, (TooManyRequests, RequestError))
+    return False
+
+def request_with_retry(call, limiter):
+    """
+    Run call() inside the provider limits, retrying transient failures (see
+    is_transient_error) with jittered exponential backoff. Other errors are
+    raised at once, sending the same request again would fail the same way.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with limiter:
+                return call()
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_transient_error(e):
+                raise
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+
+class EndpointTranslator:
+    """Minimal client for a LibreTranslate-compatible /translate endpoint"""
+
+    def __init__(self, endpoint, source='sq', target='en', timeout=60):
+        self.endpoint = endpoint
+        self.source = source
+        self.target = target
+        self.timeout = timeout
+
+    def translate(self, text):
+        response = requests.post(self.endpoint, json={
+            'q': text,
+            'source': self.source,
+            'target': self.target,
+            'format': 'text',
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['translatedText']
+
+def make_translator(target_lang, source_lang='sq'):
+    """Translator for one language pair, Google Translate unless TRANSLATE_ENDPOINT is set"""
+    if TRANSLATE_ENDPOINT:
+        return EndpointTranslator(TRANSLATE_ENDPOINT, source=source_lang, target=target_lang)
+    # Only needed without an endpoint
+    from deep_translator import GoogleTranslator
+    return GoogleTranslator(source=source_lang, target=target_lang)
+
+def thread_local_translator(target_lang, source_lang='sq'):
     """
-    Translate a transcription file to the target language
+    Return a function giving each calling thread its own translator for the
+    language pair; deep_translator's translators keep per-request state on
+    the instance, so one must never be shared between threads.
     """
+    local = threading.local()
+    def get_translator():
+        if not hasattr(local, 'translator'):
+            local.translator = make_translator(target_lang, source_lang)
+        return local.translator
+    return get_translator
+
+def pack_batches(entries, max_chars=MAX_BATCH_CHARS):
+    """
+    Group (video_id, text) entries into batches whose joined text stays under
+    max_chars. An entry longer than max_chars gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    size = 0
+    for entry in entries:
+        length = len(entry[1]) + len(BATCH_DELIMITER)
+        if batch and size + length > max_chars:
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(entry)
+        size += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+def translate_batch(get_translator, batch, stats, limiter):
+    """
+    Translate a batch of (video_id, text) entries in one request with the
+    calling thread's translator (see thread_local_translator). A request
+    rejected for its content (4xx, text too long, an answer that does not
+    split back into one line per entry) is sent again as two half batches,
+    down to single lines, to isolate the lines at fault. A request still
+    failing transiently after its retries fails the whole batch; splitting it
+    would only send more requests to a provider that is down or throttling.
+    Returns [(video_id, translated text or None, error or None)].
+    """
+    texts = [text for _, text in batch]
+    translator = get_translator()
+    with stats['lock']:
+        stats['requests'] += 1
     try:
-        # Read the input file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        translated = request_with_retry(lambda: translator.translate(BATCH_DELIMITER.join(texts)), limiter)
+        parts = (translated or '').split(BATCH_DELIMITER)
+        if len(parts) != len(texts):
+            raise ValueError(f"expected {len(texts)} lines back, got {len(parts)}")
+        return [(video_id, part.strip(), None) for (video_id, _), part in zip(batch, parts)]
+    except Exception as e:
+        if len(batch) == 1 or is_transient_error(e):
+            return [(video_id, None, e) for video_id, _ in batch]
+        middle = len(batch) // 2
+        with stats['lock']:
+            stats['splits'] += 1
+        return (translate_batch(get_translator, batch[:middle], stats, limiter)
+                + translate_batch(get_translator, batch[middle:], stats, limiter))
+
+def source_digest(text, provider):
+    """Short digest of a source text, a checkpointed line is redone when it changes"""
+    return hashlib.sha256(f"{provider}\x1f{normalize_text(text)}".encode('utf-8')).hexdigest()[:16]
+
+def checkpointed_translation(progress, video_id, digest):
+    """Translation of video_id from the progress log if it was made from the current text, else None"""
+    saved = progress.get(video_id)
+    if saved is None:
+        return None
+    parts = saved.split(' ', 1)
+    if parts[0] != digest:
+        return None
+    return parts[1] if len(parts) > 1 else ''
+
+def iter_input_lines(input_file):
+    """
+    Stream the lines of a transcription file as (key, line, text), line
+    stripped. Lines without a colon come with key None and are copied as they
+    are. key is the video_id; a video_id found on several consecutive lines
+    (the transcription scripts write a video's lines together) is translated
+    once per line, its later lines are checkpointed as video_id#2, video_id#3...
+    Only the previous id is remembered, so memory stays flat however long the
+    file; a repeat further down shares the first key, and the source digest
+    stored with the checkpoint keeps it from reusing the other line's
+    translation.
+    """
+    previous_id, count = None, 0
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if ':' not in line:
+                yield None, line, None
+                continue
+            # Split at the first colon to separate filename from text
+            video_id, text = line.split(':', 1)
+            video_id = video_id.strip()
+            count = count + 1 if video_id == previous_id else 1
+            previous_id = video_id
+            key = video_id if count == 1 else f"{video_id}#{count}"
+            yield key, line, text.strip()
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def translate_chunk(chunk, get_translator, target_lang, lang_name, context):
+    """
+    Translate a chunk of (video_id, text) entries. Every distinct text is
+    translated once; texts found in the translation memory are not sent
+    again, the others are batched and sent concurrently within the limits of
+    the provider. Returns {text: translation} for the texts translated.
+    """
+    memory, provider, stats = context['memory'], context['provider'], context['stats']
+    first_seen = {}
+    for video_id, text in chunk:
+        first_seen.setdefault(text, video_id)
+    translations = memory.lookup_many(first_seen, 'sq', target_lang, provider)
+    stats['memory_hits'] += len(translations)
+
+    batches = pack_batches([(video_id, text) for text, video_id in first_seen.items() if text not in translations])
+    # map() yields in submission order
+    for batch, translated in zip(batches, context['pool'].map(
+            lambda batch: translate_batch(get_translator, batch, stats, context['limiter']), batches)):
+        new_translations = {}
+        # Results come back in batch order; video ids may repeat, so pair them by position
+        for (_, text), (video_id, translated_text, error) in zip(batch, translated):
+            if error is not None:
+                print(f"  [{lang_name}] Error translating {video_id}: {error}")
+                continue
+            new_translations[text] = translated_text
+        memory.store_many(new_translations, 'sq', target_lang, provider)
+        translations.update(new_translations)
+    return translations
+
+def translate_file(input_file, target_lang, lang_name, output_file=None):
+    """
+    Translate a transcription file to the target language.
+
+    The input is streamed in chunks and every translated line is checkpointed
+    in the progress log next to the output file as soon as its batch is back.
+    A rerun, after a crash or after transcripts were added or changed, only
+    translates the lines that are missing from the log or whose source text
+    changed. The output file is written from the log at the end, in input
+    order, with lines that could not be translated and lines without a
+    colon kept as they are.
+    Returns the output file, or None if the file could not be translated.
+    """
+    try:
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(input_file)
+        
+        # Create translator instances, one per worker thread
+        get_translator = thread_local_translator(target_lang, source_lang='sq')  # sq = Albanian
         
-        # Create translator instance
-        translator = GoogleTranslator(source='sq', target=target_lang)  # sq = Albanian
+        # Determine output filename based on input file
+        if output_file is None:
+            output_file = default_output_file(input_file, target_lang)
+        if os.path.dirname(output_file):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        progress = TranscriptStore(output_file + PROGRESS_SUFFIX)
         
-        # Prepare translated lines
-        translated_lines = []
+        provider = provider_name()
+        stats = {'requests': 0, 'splits': 0, 'memory_hits': 0, 'lock': threading.Lock()}
+        counts = {'lines': 0, 'resumed': 0, 'translated': 0, 'failed': 0}
         
         print(f"Translating {input_file} to {lang_name}...")
         
-        for i, line in enumerate(lines):
-            line = line.strip()
-            if ':' in line:
-                # Split at the first colon to separate filename from text
-                filename_part, text_part = line.split(':', 1)
-                
-                # Translate the text part
-                try:
-                    translated_text = translator.translate(text_part.strip())
-                    translated_line = f"{filename_part}:{translated_text}"
-                    translated_lines.append(translated_line)
-                    
-                    # Progress indicator
-                    if (i + 1) % 10 == 0:
-                        print(f"  Processed {i + 1}/{len(lines)} lines")
-                        
-                except Exception as e:
-                    print(f"  Error translating line {i + 1}: {e}")
-                    # Keep original line if translation fails
-                    translated_lines.append(line)
-            else:
-                # Keep lines without colon as-is
-                translated_lines.append(line)
+        def pending_entries():
+            # Empty texts need no request, checkpointed lines are skipped
+            for key, _, text in iter_input_lines(input_file):
+                counts['lines'] += 1
+                if not text:
+                    continue
+                if checkpointed_translation(progress, key, source_digest(text, provider)) is not None:
+                    counts['resumed'] += 1
+                    continue
+                yield key, text
         
-        # Determine output filename based on input file
-        if 'neura' in input_file:
-            output_file = f"neura/{target_lang}_translation.txt"
-            # Create neura directory if it doesn't exist
-            os.makedirs('neura', exist_ok=True)
-        else:
-            output_file = f"{target_lang}_translation.txt"
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as pool:
+            context = {'memory': translation_memory(), 'provider': provider, 'stats': stats,
+                       'limiter': provider_limiter(), 'pool': pool}
+            for chunk in iter_chunks(pending_entries(), CHUNK_SIZE):
+                translations = translate_chunk(chunk, get_translator, target_lang, lang_name, context)
+                progress.extend((video_id, f"{source_digest(text, provider)} {translations[text]}")
+                                for video_id, text in chunk if text in translations)
+                translated = sum(1 for _, text in chunk if text in translations)
+                counts['translated'] += translated
+                counts['failed'] += len(chunk) - translated
+                print(f"  [{lang_name}] Translated {counts['translated']} lines "
+                      f"({counts['resumed']} already done, {stats['requests']} requests)")
         
-        # Write translated content to output file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for line in translated_lines:
-                f.write(line + '\n')
+        # Write translated content to output file, atomically so a crash here
+        # never leaves a truncated translation behind. The progress log is
+        # rewritten alongside with only the lines still in the input, so
+        # superseded and removed lines never pile up in it
+        temp_file = f"{output_file}.tmp"
+        temp_progress = f"{progress.path}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f, open(temp_progress, 'w', encoding='utf-8') as log:
+                for key, line, text in iter_input_lines(input_file):
+                    digest = source_digest(text, provider) if text else None
+                    translation = checkpointed_translation(progress, key, digest) if text else None
+                    if translation is None and text:
+                        # A repeated id further down shares its key, the memory still has both texts
+                        translation = translation_memory().lookup_many([text], 'sq', target_lang, provider).get(text)
+                    # Keep original line if translation failed
+                    if translation is None:
+                        f.write(line + '\n')
+                        continue
+                    f.write(f"{line.split(':', 1)[0]}:{translation}\n")
+                    log.write(f"{key}:{digest} {translation}\n")
+            progress.close()
+            os.replace(temp_file, output_file)
+            # The progress index notices the new file and re-indexes it on the next run
+            os.replace(temp_progress, progress.path)
+        except BaseException:
+            for path in (temp_file, temp_progress):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
         
-        print(f"  ✓ Created {output_file}")
+        print(f"  ✓ Created {output_file} ({counts['lines']} lines: {counts['resumed']} resumed, "
+              f"{counts['translated']} translated, {counts['failed']} failed; {stats['requests']} requests, "
+              f"{stats['memory_hits']} memory hits, {stats['splits']} batch splits)")
+        if counts['failed']:
+            print(f"  [{lang_name}] Run again to retry the {counts['failed']} failed lines")
+        return output_file
         
     except FileNotFoundError:
         print(f"  ✗ Input file {input_file} not found")
     except Exception as e:
-        print(f"  ✗ Error processing {input_file}: {e}")
+        print(f"  ✗ Error processing {input_file} for {lang_name}: {e}")
+    return None
+
+def default_output_file(input_file, target_lang):
+    """Translation file written for input_file when no output file is given"""
+    if 'neura' in input_file:
+        return f"neura/{target_lang}_translation.txt"
+    return f"{target_lang}_translation.txt"
+
+def translate_languages(input_file, target_languages, output_files=None):
+    """
+    Translate input_file to every language in target_languages ({code: name})
+    at the same time. All languages share the per-provider request limits, so
+    a run takes about as long as the slowest language.
+    output_files optionally maps a language code to its output file.
+    Returns {code: output file or None}.
+    """
+    output_files = output_files or {}
+    with ThreadPoolExecutor(max_workers=max(1, len(target_languages))) as pool:
+        futures = {lang_code: pool.submit(translate_file, input_file, lang_code, lang_name,
+                                          output_files.get(lang_code))
+                   for lang_code, lang_name in target_languages.items()}
+        return {lang_code: future.result() for lang_code, future in futures.items()}
 
 def main():
     """
@@ -92,22 +450,19 @@ def main():
     print(f"Processing: {input_file}")
     print("-" * 30)
     
-    for lang_code, lang_name in languages.items():
-        translate_file(input_file, lang_code, lang_name)
+    started = time.time()
+    results = translate_languages(input_file, languages)
     
     print("\n" + "=" * 50)
-    print("Translation process completed!")
+    print(f"Translation process completed in {time.time() - started:.1f}s!")
     print("\nCreated files:")
     
     # List all created translation files
-    for lang_code in languages.keys():
-        if 'neura' in input_file:
-            output_file = f"neura/{lang_code}_translation.txt"
-        else:
-            output_file = f"{lang_code}_translation.txt"
-        
-        if os.path.exists(output_file):
+    for lang_code, output_file in results.items():
+        if output_file:
             print(f"  ✓ {output_file}")
+        else:
+            print(f"  ✗ {languages[lang_code]} failed")
 
 if __name__ == "__main__":
     main()
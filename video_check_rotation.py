@@ -1,87 +1,286 @@
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import cv2
 import mediapipe as mp
 import numpy as np
 
-def check_rotations_for_face_detection(video_path, num_frames_to_check=10, model_selection=0, min_detection_confidence=0.6):
+# Rotations to try (clockwise)
+rotations = {
+    0: "0 degrees (Original)",
+    90: "90 degrees clockwise",
+    180: "180 degrees clockwise",
+    270: "270 degrees clockwise"
+}
+
+# OpenCV's rotate codes
+cv_rot_codes = {
+    0: None, # No rotation
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE # 270 CW is 90 CCW
+}
+
+# Extra rotations tried after the metadata rotation, most likely first: metadata is
+# usually right, a missing flag leaves the video sideways, upside down is rare
+ROTATION_ORDER = (0, 90, 270, 180)
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v')
+
+# Set in every survey worker process by _init_survey_worker()
+_face_detection = None
+
+def probe_rotation(video_path):
+    """
+    Read the rotation a player applies to video_path from its display matrix
+    (or the older `rotate` tag) with a single ffprobe call.
+    Returns the clockwise rotation in degrees: 0, 90, 180 or 270.
+    """
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream_tags=rotate:stream_side_data=rotation',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    streams = json.loads(result.stdout or '{}').get('streams') or [{}]
+    stream = streams[0]
+
+    # The display matrix angle is counterclockwise, e.g. -90 for a phone held upright
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(round(-float(side_data['rotation']) / 90)) * 90 % 360
+    rotate = stream.get('tags', {}).get('rotate')
+    if rotate:
+        return int(round(float(rotate) / 90)) * 90 % 360
+    return 0
+
+def rotate_frame(frame, degrees):
+    """Rotate a frame clockwise by 0, 90, 180 or 270 degrees"""
+    if cv_rot_codes[degrees] is None:
+        return frame
+    return cv2.rotate(frame, cv_rot_codes[degrees])
+
+def open_upright_capture(video_path):
+    """
+    Open video_path for decoding and return (cap, rotation).
+
+    OpenCV's own orientation handling differs between builds and backends, so
+    it is switched off and the rotation probed once with ffprobe is returned
+    instead; pass every decoded frame through rotate_frame(frame, rotation)
+    to get it upright, without re-encoding the video first. rotation is 0 if
+    the metadata cannot be read.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return cap, 0
+    if hasattr(cv2, 'CAP_PROP_ORIENTATION_AUTO'):
+        cap.set(cv2.CAP_PROP_ORIENTATION_AUTO, 0)
+    try:
+        rotation = probe_rotation(video_path)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
+        print(f"Could not read rotation metadata of {video_path}: {e}. Assuming upright.")
+        rotation = 0
+    return cap, rotation
+
+def sample_frames(cap, count, rotation=0):
+    """
+    Read count frames spread evenly over the video by seeking, turned upright
+    by rotation. Falls back to the first count frames when the container does
+    not report a frame count.
+    """
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    frames = []
+    if total > 0:
+        for i in range(count):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int((i + 0.5) * total / count))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(rotate_frame(frame, rotation))
+    if not frames:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(rotate_frame(frame, rotation))
+    return frames
+
+def find_face_rotation(frames, face_detection, order=ROTATION_ORDER):
+    """
+    Try the rotations in order on every frame and stop at the first face.
+    Returns (degrees, detector_calls), degrees being None if no rotation finds a face.
+    """
+    calls = 0
+    for degrees in order:
+        for frame in frames:
+            # Convert the BGR image to RGB.
+            image_rgb = cv2.cvtColor(rotate_frame(frame, degrees), cv2.COLOR_BGR2RGB)
+            image_rgb.flags.writeable = False # To improve performance
+            calls += 1
+            if face_detection.process(image_rgb).detections:
+                return degrees, calls
+    return None, calls
+
+def check_rotations_for_face_detection(video_path, num_frames_to_check=5, model_selection=0, min_detection_confidence=0.6):
+    """
+    Check which rotation makes faces detectable in video_path.
+
+    The rotation stored in the metadata is read first and applied to a few
+    frames sampled across the video. The detector runs on that orientation
+    first, and the other rotations are only tried, most likely first, if it
+    finds no face. Returns the extra clockwise rotation (on top of the
+    metadata) that makes faces detectable, or None if no rotation does.
+    """
     mp_face_detection = mp.solutions.face_detection
-    
+
     print(f"Checking video: {video_path}")
-    print(f"Will check the first {num_frames_to_check} frames for face detection across rotations.")
 
-    cap = cv2.VideoCapture(video_path)
+    cap, metadata_rotation = open_upright_capture(video_path)
     if not cap.isOpened():
         print(f"Error: Could not open video {video_path}. Please check the path.")
-        return
+        return None
+    print(f"Rotation metadata: {metadata_rotation} degrees clockwise")
+    frames = sample_frames(cap, num_frames_to_check, metadata_rotation)
+    cap.release()
 
     # Using model_selection=1 for general case, can try 0 if faces are very close
     with mp_face_detection.FaceDetection(
         model_selection=model_selection, min_detection_confidence=min_detection_confidence) as face_detection:
-        
-        frame_count = 0
-        while cap.isOpened() and frame_count < num_frames_to_check:
-            ret, frame = cap.read()
-            if not ret:
-                print(f"Reached end of video or failed to read frame {frame_count}.")
-                break
+        degrees, calls = find_face_rotation(frames, face_detection)
 
-            print(f"\n--- Checking Frame {frame_count} ---")
-            
-            # Define rotations to try (clockwise)
-            rotations = {
-                0: "0 degrees (Original)",
-                90: "90 degrees clockwise",
-                180: "180 degrees clockwise",
-                270: "270 degrees clockwise"
-            }
-            
-            # OpenCV's rotate codes
-            cv_rot_codes = {
-                0: None, # No rotation
-                90: cv2.ROTATE_90_CLOCKWISE,
-                180: cv2.ROTATE_180,
-                270: cv2.ROTATE_90_COUNTERCLOCKWISE # 270 CW is 90 CCW
-            }
-
-            face_detected_in_frame = False
-            for degrees, description in rotations.items():
-                rotated_frame = frame.copy()
-                if cv_rot_codes[degrees] is not None:
-                    rotated_frame = cv2.rotate(frame, cv_rot_codes[degrees])
-                
-                # Convert the BGR image to RGB.
-                image_rgb = cv2.cvtColor(rotated_frame, cv2.COLOR_BGR2RGB)
-                image_rgb.flags.writeable = False # To improve performance
-                results = face_detection.process(image_rgb)
-                image_rgb.flags.writeable = True
-
-                if results.detections:
-                    print(f"  Face detected at {description}!")
-                    face_detected_in_frame = True
-                    # Optionally, you can display the frame with detection for visual confirmation
-                    # mp_drawing = mp.solutions.drawing_utils
-                    # annotated_image = rotated_frame.copy()
-                    # for detection in results.detections:
-                    #     mp_drawing.draw_detection(annotated_image, detection)
-                    # cv2.imshow(f'Frame {frame_count} - {description}', annotated_image)
-                    # cv2.waitKey(0) # Wait for a key press
-                    # cv2.destroyAllWindows()
-                    break # Stop checking rotations for this frame once a face is found
-                else:
-                    print(f"  No face detected at {description}.")
-
-            if not face_detected_in_frame:
-                print(f"No face detected in Frame {frame_count} at any tested rotation.")
-
-            frame_count += 1
-            
-    cap.release()
-    cv2.destroyAllWindows()
-    print("\nFinished checking frames.")
-
-# --- Example Usage ---
-# Replace 'path/to/your/video.mp4' with the actual path to your video.
-# Use the video that you had rotated 180 degrees for your script, as it was the last attempt.
-# Or, use your absolute original video to see which rotation (0, 90, 180, 270) helps.
-check_rotations_for_face_detection('videos/rotated_180_cropped.mp4')
-# You can also test with the original video:
-# check_rotations_for_face_detection('videos/20250429_115126.mp4')
\ No newline at end of file
+    if degrees is None:
+        print(f"No face detected at any tested rotation in {len(frames)} sampled frames.")
+    else:
+        print(f"Face detected at {rotations[degrees]} (after applying the metadata rotation), "
+              f"{calls} detector call(s)")
+    return degrees
+
+def _init_survey_worker(model_selection=0, min_detection_confidence=0.6):
+    """Pool initializer: each worker process holds its own MediaPipe graph"""
+    global _face_detection
+    _face_detection = mp.solutions.face_detection.FaceDetection(
+        model_selection=model_selection, min_detection_confidence=min_detection_confidence)
+
+def survey_video(video_path, num_frames=5):
+    """Survey worker: orientation report of one video, see survey_rotations()"""
+    started = time.time()
+    report = {
+        'file': video_path,
+        'metadata_rotation': None,
+        'extra_rotation': None,
+        'orientation': None,
+        'frames_sampled': 0,
+        'detector_calls': 0,
+        'seconds': 0.0,
+        'error': None,
+    }
+    try:
+        cap, metadata_rotation = open_upright_capture(video_path)
+        if not cap.isOpened():
+            raise IOError("could not open video")
+        frames = sample_frames(cap, num_frames, metadata_rotation)
+        cap.release()
+        degrees, calls = find_face_rotation(frames, _face_detection)
+        report.update(metadata_rotation=metadata_rotation, extra_rotation=degrees,
+                      frames_sampled=len(frames), detector_calls=calls)
+        if degrees is not None:
+            report['orientation'] = (metadata_rotation + degrees) % 360
+    except Exception as e:
+        report['error'] = str(e)
+    report['seconds'] = round(time.time() - started, 3)
+    return report
+
+def list_videos(folder):
+    """All video files below folder, sorted"""
+    videos = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if file.lower().endswith(VIDEO_EXTENSIONS):
+                videos.append(os.path.join(root, file))
+    return sorted(videos)
+
+def write_survey_report(reports, report_path):
+    """Write the survey as JSON, or as CSV when report_path ends with .csv"""
+    if report_path.lower().endswith('.csv'):
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(reports[0]) if reports else ['file'])
+            writer.writeheader()
+            writer.writerows(reports)
+    else:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+
+def survey_rotations(video_files, num_frames=5, jobs=None, report_path=None):
+    """
+    Find the orientation of many videos in parallel.
+
+    Every video gets its metadata rotation probed and num_frames frames sampled
+    by seeking; rotations are then tried most likely first (ROTATION_ORDER)
+    and the search stops at the first face. orientation in the report is the
+    total clockwise rotation that makes the video upright (metadata_rotation +
+    extra_rotation), None when no face was found at any rotation.
+    Returns the reports in the order of video_files.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    reports = {}
+    # spawn, not fork: a forked worker would inherit the parent's threads and any MediaPipe/OpenCV state
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_survey_worker,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(survey_video, video_path, num_frames): video_path for video_path in video_files}
+        for future in as_completed(futures):
+            report = future.result()
+            reports[report['file']] = report
+            if report['error']:
+                status = f"error: {report['error']}"
+            elif report['orientation'] is None:
+                status = "no face found"
+            else:
+                status = f"rotate {report['orientation']} degrees clockwise"
+            print(f"[{len(reports)}/{len(video_files)}] {report['file']}: {status} "
+                  f"({report['detector_calls']} detector calls, {report['seconds']:.2f}s)")
+
+    reports = [reports[video_path] for video_path in video_files]
+    if report_path:
+        write_survey_report(reports, report_path)
+        print(f"Rotation report saved to {report_path}")
+    return reports
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Find the orientation of every video in a folder.')
+    parser.add_argument('folder', help='Folder searched recursively for videos')
+    parser.add_argument('--frames', '-k', type=int, default=5,
+                        help='Frames sampled per video (default: 5)')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='Number of videos surveyed in parallel (default: number of CPU cores)')
+    parser.add_argument('--report', default='rotation_report.json',
+                        help='Report file, CSV if it ends with .csv (default: rotation_report.json)')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        args = parse_arguments()
+        video_files = list_videos(args.folder)
+        if not video_files:
+            print(f"No videos found in {args.folder}")
+            sys.exit(1)
+        survey_rotations(video_files, num_frames=args.frames, jobs=args.jobs, report_path=args.report)
+        sys.exit(0)
+
+    # --- Example Usage ---
+    # Replace 'path/to/your/video.mp4' with the actual path to your video.
+    # Use the video that you had rotated 180 degrees for your script, as it was the last attempt.
+    # Or, use your absolute original video to see which rotation (0, 90, 180, 270) helps.
+    check_rotations_for_face_detection('videos/rotated_180_cropped.mp4')
+    # You can also test with the original video:
+    # check_rotations_for_face_detection('videos/20250429_115126.mp4')
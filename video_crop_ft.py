@@ -1,111 +1,714 @@
+import os
+import json
+import math
+import queue
+import hashlib
+import itertools
+import threading
+import subprocess
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import mediapipe as mp
 import numpy as np
 
-def crop_and_center_face(input_video_path, output_video_path, target_size=512, target_fps=25):
-    mp_face_detection = mp.solutions.face_detection
-    mp_drawing = mp.solutions.drawing_utils
+from audio_cache import SourceHashes
+from video_check_rotation import open_upright_capture, rotate_frame
+
+# Frames waiting between the reader, the detector pool and the writer
+DEFAULT_QUEUE_SIZE = 32
+
+# Longest side frames are scaled down to before face detection. MediaPipe's
+# short-range model runs at 128x128 internally, so this loses no accuracy.
+DEFAULT_DETECTION_SIZE = 256
+
+# Per-video face tracks (one box per frame) shared by every render of the video
+FACE_TRACK_DIR = "face_tracks"
+# Bump when the detection or the track layout changes, invalidates all tracks
+FACE_TRACK_VERSION = 3
+# Content hashes of the tracked videos, kept in track_dir so an unchanged video is not re-hashed
+SOURCE_HASHES_NAME = "sources.sqlite3"
+
+# libx264 settings of the ffmpeg output path
+DEFAULT_X264_PRESET = "veryfast"
+DEFAULT_X264_CRF = 18
+
+# Columns of the per-frame quality index written next to each face track
+QUALITY_COLUMNS = ('frame', 'detected', 'confidence', 'box_area', 'blur', 'brightness', 'mouth_visibility')
+# MediaPipe face detection keypoint index of the mouth center
+MOUTH_KEYPOINT = 3
+
+# Side of the grayscale thumbnail used to measure motion between frames, and the
+# mean absolute difference (0-255) against the last keyframe that forces a detection
+MOTION_THUMBNAIL_SIZE = 32
+DEFAULT_MOTION_THRESHOLD = 8.0
+
+# Set in every detector worker process by _init_face_detector()
+_face_detection = None
+
+def _init_face_detector(model_selection=0, min_detection_confidence=0.6):
+    """Pool initializer: each worker process holds its own MediaPipe graph"""
+    global _face_detection
+    _face_detection = mp.solutions.face_detection.FaceDetection(
+        model_selection=model_selection, min_detection_confidence=min_detection_confidence)
+
+def detection_frame(frame, detection_size=DEFAULT_DETECTION_SIZE):
+    """
+    Scale frame down so its longest side is detection_size, keeping the aspect
+    ratio. Detection boxes are relative, so they apply unchanged to the
+    full-resolution frame. Frames already small enough (or detection_size=None)
+    are returned as is.
+    """
+    height, width = frame.shape[:2]
+    scale = detection_size / max(height, width) if detection_size else 1
+    if scale >= 1:
+        return frame
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+def mouth_visibility(box, mouth):
+    """
+    Fraction of the mouth region (half the face wide, an eighth of it high,
+    around the mouth keypoint) that lies inside the frame, in relative units.
+    """
+    half_width, half_height = box[2] / 4, box[3] / 16
+    if half_width <= 0 or half_height <= 0:
+        return 0.0
+    inside_x = max(0.0, min(1.0, mouth[0] + half_width) - max(0.0, mouth[0] - half_width))
+    inside_y = max(0.0, min(1.0, mouth[1] + half_height) - max(0.0, mouth[1] - half_height))
+    return inside_x * inside_y / (4 * half_width * half_height)
+
+def detect_face(frame):
+    """
+    Run face detection on a (downscaled) BGR frame in a worker process.
+
+    Returns (box, quality): the first face's relative bounding box as
+    (xmin, ymin, width, height), or None, and (confidence, blur, brightness,
+    mouth_visibility) measured on the face, or on the whole frame when there
+    is none. blur is the variance of the Laplacian at detection resolution
+    (lower is blurrier), brightness the mean gray level (0-255).
+    """
+    # Convert the BGR image to RGB.
+    image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    # To improve performance, optionally mark the image as not writeable to pass by reference.
+    image_rgb.flags.writeable = False
+    results = _face_detection.process(image_rgb)
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if not results.detections:
+        return None, (0.0, float(cv2.Laplacian(gray, cv2.CV_64F).var()), float(gray.mean()), 0.0)
+
+    # Assuming only one face for simplicity, or pick the largest
+    detection = results.detections[0]
+    bbox_norm = detection.location_data.relative_bounding_box
+    box = (bbox_norm.xmin, bbox_norm.ymin, bbox_norm.width, bbox_norm.height)
+
+    height, width = gray.shape
+    x1, y1 = max(0, int(box[0] * width)), max(0, int(box[1] * height))
+    x2, y2 = min(width, int((box[0] + box[2]) * width)), min(height, int((box[1] + box[3]) * height))
+    face = gray[y1:y2, x1:x2] if x2 > x1 and y2 > y1 else gray
+
+    mouth = detection.location_data.relative_keypoints[MOUTH_KEYPOINT]
+    quality = (
+        float(detection.score[0]),
+        float(cv2.Laplacian(face, cv2.CV_64F).var()),
+        float(face.mean()),
+        mouth_visibility(box, (mouth.x, mouth.y)),
+    )
+    return box, quality
+
+def crop_frame(frame, box, target_size):
+    """Crop a target_size square from frame centered on box (relative), or on the frame center if box is None"""
+    original_height, original_width = frame.shape[:2]
+
+    if box is not None:
+        # Convert normalized bounding box to pixel coordinates
+        x_min = int(box[0] * original_width)
+        y_min = int(box[1] * original_height)
+        width = int(box[2] * original_width)
+        height = int(box[3] * original_height)
+
+        # Calculate center of the face
+        face_center_x = x_min + width // 2
+        face_center_y = y_min + height // 2
+
+        # Calculate crop boundaries to center the face
+        crop_x1 = max(0, face_center_x - target_size // 2)
+        crop_y1 = max(0, face_center_y - target_size // 2)
+        crop_x2 = min(original_width, face_center_x + target_size // 2)
+        crop_y2 = min(original_height, face_center_y + target_size // 2)
+
+        # Adjust if crop goes out of bounds at the edges
+        if crop_x2 - crop_x1 < target_size:
+            if crop_x1 == 0:
+                crop_x2 = target_size
+            elif crop_x2 == original_width:
+                crop_x1 = original_width - target_size
+
+        if crop_y2 - crop_y1 < target_size:
+            if crop_y1 == 0:
+                crop_y2 = target_size
+            elif crop_y2 == original_height:
+                crop_y1 = original_height - target_size
+
+        # Ensure the final crop size is exactly target_size
+        crop_x2 = crop_x1 + target_size
+        crop_y2 = crop_y1 + target_size
+
+        # Perform the crop
+        cropped_frame = frame[crop_y1:crop_y2, crop_x1:crop_x2]
+    else:
+        # No face detected, center crop
+        center_x = original_width // 2
+        center_y = original_height // 2
+        crop_x1 = max(0, center_x - target_size // 2)
+        crop_y1 = max(0, center_y - target_size // 2)
+        cropped_frame = frame[crop_y1 : crop_y1 + target_size, crop_x1 : crop_x1 + target_size]
+
+    # Resize if the cropped frame is not exactly target_size (e.g., at edges)
+    if cropped_frame.shape[0] != target_size or cropped_frame.shape[1] != target_size:
+        cropped_frame = cv2.resize(cropped_frame, (target_size, target_size))
+    return cropped_frame
+
+def motion_thumbnail(frame):
+    """Tiny grayscale copy of frame, cheap to compare against the last detected frame"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (MOTION_THUMBNAIL_SIZE, MOTION_THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+
+def interpolate_box(box0, box1, index0, index1, index):
+    """Linearly interpolate a relative box between detections at frames index0 and index1"""
+    if box0 is None:
+        return box1
+    if box1 is None:
+        return box0
+    t = (index - index0) / (index1 - index0)
+    return tuple(a + (b - a) * t for a, b in zip(box0, box1))
+
+class BoxSmoother:
+    """
+    Constant-velocity Kalman filter over a relative box (xmin, ymin, width, height),
+    one independent filter per coordinate. Removes detector jitter while
+    following real head motion without the lag of a plain moving average.
+    """
+
+    def __init__(self, process_noise=1e-6, measurement_noise=2.5e-5):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.position = None
+
+    def update(self, box):
+        measured = np.asarray(box, dtype=np.float64)
+        if self.position is None:
+            self.position = measured
+            self.velocity = np.zeros(4)
+            self.p00 = np.full(4, self.measurement_noise)
+            self.p01 = np.zeros(4)
+            self.p11 = np.full(4, self.measurement_noise)
+            return box
+
+        # Predict one frame ahead
+        self.position = self.position + self.velocity
+        self.p00 = self.p00 + 2 * self.p01 + self.p11 + self.process_noise
+        self.p01 = self.p01 + self.p11
+        self.p11 = self.p11 + self.process_noise
+
+        # Correct with the measured box
+        gain0 = self.p00 / (self.p00 + self.measurement_noise)
+        gain1 = self.p01 / (self.p00 + self.measurement_noise)
+        residual = measured - self.position
+        self.position = self.position + gain0 * residual
+        self.velocity = self.velocity + gain1 * residual
+        self.p11 = self.p11 - gain1 * self.p01
+        self.p01 = (1 - gain0) * self.p01
+        self.p00 = (1 - gain0) * self.p00
+        return tuple(self.position)
+
+def put_until_stopped(q, item, stop_event):
+    """Put item on a bounded queue, giving up once stop_event is set. Returns True if it was queued."""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+class FrameResampler:
+    """
+    Decide, from each decoded frame's timestamp, how many output frames it
+    becomes when the video is resampled to target_fps: output frame k (at
+    k / target_fps s) shows the source frame closest to that time. Works on
+    the real presentation timestamps, so variable frame rate sources keep
+    their timing. 0 means the frame is dropped, more than 1 that it is
+    repeated.
+
+    A frame's share ends halfway to the next frame, which is not decoded yet,
+    so the previous frame interval stands in for it. nominal_fps is only used
+    for the first frame and when the backend reports no usable timestamp.
+    """
+
+    def __init__(self, target_fps, nominal_fps=None):
+        self.output_interval = 1000.0 / target_fps if target_fps else None
+        self.nominal_interval = 1000.0 / nominal_fps if nominal_fps and not math.isnan(nominal_fps) else None
+        self.last_timestamp = None
+        self.last_interval = self.nominal_interval or self.output_interval
+        self.output_index = 0
+
+    def repeats(self, timestamp_ms):
+        """Output frames for the source frame decoded at timestamp_ms"""
+        if self.output_interval is None:
+            # No target frame rate, keep every frame
+            return 1
+        if timestamp_ms is None or math.isnan(timestamp_ms) or (
+                self.last_timestamp is not None and timestamp_ms <= self.last_timestamp):
+            # Missing or non-increasing timestamp: assume a regular frame interval
+            timestamp_ms = 0.0 if self.last_timestamp is None else \
+                self.last_timestamp + (self.nominal_interval or self.last_interval)
+        if self.last_timestamp is not None:
+            self.last_interval = timestamp_ms - self.last_timestamp
+        self.last_timestamp = timestamp_ms
+
+        # Output times before the midpoint to the (estimated) next frame show this frame
+        share_end = timestamp_ms + self.last_interval / 2
+        count = 0
+        while self.output_index * self.output_interval < share_end:
+            count += 1
+            self.output_index += 1
+        return count
+
+def read_frames(cap, frame_queue, stop_event, resampler=None, rotation=0):
+    """
+    Reader thread: put (index, frame, repeats, timestamp_ms) for every source
+    frame into frame_queue (blocking while it is full), then None. repeats
+    comes from resampler (a FrameResampler; None keeps every frame once) fed
+    with the frame's CAP_PROP_POS_MSEC. Frames are turned upright by rotation
+    (clockwise degrees). Frames the resampling drops are only grabbed, never
+    converted, and come with frame=None.
+    """
+    try:
+        for index in itertools.count():
+            if stop_event.is_set() or not cap.grab():
+                break
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+            count = resampler.repeats(timestamp) if resampler else 1
+            frame = None
+            if count:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                frame = rotate_frame(frame, rotation)
+            if not put_until_stopped(frame_queue, (index, frame, count, timestamp), stop_event):
+                break
+    finally:
+        put_until_stopped(frame_queue, None, stop_event)
+
+def write_frames(write, write_queue, stop_event, errors):
+    """
+    Writer thread: pass cropped frames to write() in the order they arrive
+    until None. If write() fails, the error is appended to errors and
+    stop_event is set so the other threads stop feeding it.
+    """
+    try:
+        while True:
+            frame = write_queue.get()
+            if frame is None:
+                break
+            write(frame)
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+
+def build_x264_pipe_command(output_video_path, size, fps, preset=DEFAULT_X264_PRESET, crf=DEFAULT_X264_CRF,
+                            threads=0):
+    """ffmpeg command encoding raw BGR frames read from stdin with libx264 (threads=0: one per core)"""
+    return [
+        'ffmpeg',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'bgr24',
+        '-s', f'{size}x{size}',
+        '-r', str(fps),
+        '-i', 'pipe:0',
+        '-c:v', 'libx264',
+        '-preset', preset,
+        '-crf', str(crf),
+        '-pix_fmt', 'yuv420p',
+        '-threads', str(threads),
+        '-y', output_video_path
+    ]
+
+_source_hashes = {}
+_source_hashes_lock = threading.Lock()
+
+def source_hash(input_video_path, track_dir=FACE_TRACK_DIR):
+    """Content hash of a video, only re-hashed when its size, mtime or inode changed (see SourceHashes)"""
+    with _source_hashes_lock:
+        if track_dir not in _source_hashes:
+            _source_hashes[track_dir] = SourceHashes(os.path.join(track_dir, SOURCE_HASHES_NAME))
+        hashes = _source_hashes[track_dir]
+    return hashes.content_hash(input_video_path)
+
+def face_track_path(input_video_path, params, track_dir=FACE_TRACK_DIR):
+    """
+    Sidecar path of the face track of a video, keyed by the video's content hash
+    and the detection params. Its quality index lives next to it, see face_quality_path().
+    """
+    payload = json.dumps({
+        'version': FACE_TRACK_VERSION,
+        'source': source_hash(input_video_path, track_dir),
+        'params': params,
+    }, sort_keys=True)
+    return os.path.join(track_dir, hashlib.sha256(payload.encode('utf-8')).hexdigest() + ".npy")
+
+def face_quality_path(track_path):
+    """Quality index sidecar belonging to a face track sidecar"""
+    return os.path.splitext(track_path)[0] + ".quality.npz"
+
+def detect_face_track(input_video_path, workers=None, queue_size=DEFAULT_QUEUE_SIZE, detect_every=1,
+                      motion_threshold=DEFAULT_MOTION_THRESHOLD, smooth=None,
+                      detection_size=DEFAULT_DETECTION_SIZE):
+    """
+    First pass: find the face box of every frame of a video.
+
+    Frames flow through a pipeline: a reader thread decodes them and a pool of
+    `workers` processes (default: one per core) runs MediaPipe face detection,
+    each with its own graph. Results are collected in the original frame order,
+    and at most queue_size frames wait in between, so a slow stage makes the
+    faster ones wait instead of buffering the whole video.
+
+    With detect_every=N > 1 the detector only runs on keyframes: every Nth frame,
+    or earlier when the mean absolute difference of a 32x32 grayscale thumbnail
+    against the last keyframe exceeds motion_threshold (0-255 scale, 0 disables).
+    Boxes of the frames in between are interpolated between the surrounding
+    keyframes, and a keyframe without a face keeps the last known box.
+    smooth runs the boxes through a Kalman filter (BoxSmoother); it defaults to
+    on when detect_every > 1.
+
+    Detection runs on a copy scaled to detection_size px on its longest side
+    (None for full resolution), which makes both the color conversion and the
+    inference cheaper and keeps the frames sent to the workers small.
+
+    Frames are turned upright from the rotation metadata while decoding (see
+    open_upright_capture), so rotated phone recordings need no re-encode first.
+
+    Returns (track, quality), or None if the video cannot be opened. track is a
+    float32 array of shape (frames, 4) holding the relative (xmin, ymin, width,
+    height) of each upright frame, NaN where no face was found. quality is the
+    per-frame index as a dict of column arrays (QUALITY_COLUMNS):
+    detected (1 face found, 0 none found, -1 detector not run on the frame),
+    confidence, box_area (fraction of the frame), blur, brightness and
+    mouth_visibility (see detect_face); measurements are NaN where the
+    detector did not run.
+    """
+    cap, rotation = open_upright_capture(input_video_path)
+    if not cap.isOpened():
+        print(f"Error: Could not open video {input_video_path}")
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    detect_every = max(1, detect_every)
+    if smooth is None:
+        smooth = detect_every > 1
+    smoother = BoxSmoother() if smooth else None
+    # Frames between two keyframes have to wait for the next keyframe's detection
+    window = max(queue_size, detect_every + 1)
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    boxes = []
+    quality = {name: [] for name in QUALITY_COLUMNS}
+
+    # Spawned workers: forking a process that already runs threads is unsafe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_face_detector) as pool:
+        reader = threading.Thread(target=read_frames, args=(cap, frame_queue, stop_event, None, rotation), daemon=True)
+        reader.start()
+
+        # (index, detection future or None), oldest first, so results come out in order
+        pending = deque()
+        pending_keyframes = 0
+        detections = 0
+        # Last keyframe that has been collected, and the thumbnail of the last one submitted
+        key_index, key_box = None, None
+        last_submitted, last_thumbnail = -detect_every, None
+
+        def next_keyframe():
+            for index, future in pending:
+                if future is not None:
+                    return index, future.result()[0]
+            return None, None
+
+        def collect_oldest():
+            nonlocal key_index, key_box, pending_keyframes
+            index, future = pending.popleft()
+            measured = None
+            if future is not None:
+                pending_keyframes -= 1
+                box, measured = future.result()
+                detected = int(box is not None)
+                if box is None and detect_every > 1:
+                    box = key_box  # Use the last known face position
+                key_index, key_box = index, box
+            else:
+                next_index, next_box = next_keyframe()
+                box = interpolate_box(key_box, next_box, key_index, next_index, index)
+                detected = -1
+
+            if box is not None and smoother is not None:
+                box = smoother.update(box)
+            boxes.append(box if box is not None else (np.nan,) * 4)
 
+            confidence, blur, brightness, mouth = measured if measured is not None else (np.nan,) * 4
+            for name, value in zip(QUALITY_COLUMNS, (index, detected, confidence,
+                                                     box[2] * box[3] if box is not None else np.nan,
+                                                     blur, brightness, mouth)):
+                quality[name].append(value)
+
+        try:
+            while True:
+                item = frame_queue.get()
+                if item is None:
+                    break
+                index, frame, _, _ = item
+
+                is_keyframe = index - last_submitted >= detect_every
+                if detect_every > 1 and motion_threshold:
+                    thumbnail = motion_thumbnail(frame)
+                    if last_thumbnail is not None and not is_keyframe:
+                        is_keyframe = cv2.absdiff(thumbnail, last_thumbnail).mean() > motion_threshold
+                    if is_keyframe:
+                        last_thumbnail = thumbnail
+
+                future = None
+                if is_keyframe:
+                    future = pool.submit(detect_face, detection_frame(frame, detection_size))
+                    last_submitted = index
+                    detections += 1
+                    pending_keyframes += 1
+                pending.append((index, future))
+                # A frame between keyframes can only be collected once the next keyframe is queued
+                while len(pending) >= window and pending_keyframes:
+                    collect_oldest()
+            while pending:
+                collect_oldest()
+        finally:
+            stop_event.set()
+            reader.join()
+
+    cap.release()
+    print(f"Face track of {input_video_path}: ran face detection on {detections} of {len(boxes)} frames "
+          f"with {workers} detector process(es)")
+    quality = {name: np.array(values, dtype=np.int32 if name == 'frame' else np.int8 if name == 'detected'
+                               else np.float32)
+               for name, values in quality.items()}
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4), quality
+
+def _load_or_detect(input_video_path, track_dir, detection_params):
+    """Track and quality index sidecar paths of a video, running the detection pass if either is missing"""
+    # Only the params that change the boxes are part of the key, with their defaults filled in.
+    # The track covers every source frame whatever the output frame rate, render_face_track resamples it
+    detect_every = max(1, detection_params.get('detect_every', 1))
+    smooth = detection_params.get('smooth')
+    params = {
+        'detect_every': detect_every,
+        'smooth': detect_every > 1 if smooth is None else smooth,
+        'detection_size': detection_params.get('detection_size', DEFAULT_DETECTION_SIZE),
+    }
+    if detect_every > 1:
+        params['motion_threshold'] = detection_params.get('motion_threshold', DEFAULT_MOTION_THRESHOLD)
+    path = face_track_path(input_video_path, params, track_dir)
+    quality_path = face_quality_path(path)
+    if os.path.exists(path) and os.path.exists(quality_path):
+        print(f"Using cached face track {path}")
+        return path, quality_path
+
+    result = detect_face_track(input_video_path, **detection_params)
+    if result is None:
+        return None, None
+    track, quality = result
+    os.makedirs(track_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **quality)
+    os.replace(tmp_path, quality_path)
+    with open(tmp_path, 'wb') as f:
+        np.save(f, track)
+    os.replace(tmp_path, path)
+    return path, quality_path
+
+def load_face_track(input_video_path, track_dir=FACE_TRACK_DIR, **detection_params):
+    """
+    Return the face track of a video (see detect_face_track), reading it from
+    its .npy sidecar in track_dir when the same video was already tracked with
+    the same detection params, and running the detection pass otherwise.
+    """
+    path, _ = _load_or_detect(input_video_path, track_dir, detection_params)
+    return np.load(path) if path else None
+
+def load_face_quality(input_video_path, track_dir=FACE_TRACK_DIR, **detection_params):
+    """
+    Return the per-frame quality index of a video (see detect_face_track) as a
+    dict of column arrays, from its .quality.npz sidecar next to the face track.
+    Runs the detection pass if the video has not been tracked yet.
+    """
+    _, quality_path = _load_or_detect(input_video_path, track_dir, detection_params)
+    if not quality_path:
+        return None
+    with np.load(quality_path) as columns:
+        return {name: columns[name] for name in columns.files}
+
+def good_frame_segments(quality, min_confidence=0.8, min_blur=None, min_brightness=40, max_brightness=220,
+                        min_mouth_visibility=0.9, min_box_area=None, min_length=25):
+    """
+    Frame ranges [start, end) worth training on: every frame the detector ran on
+    has a face passing all thresholds (None skips one), frames in between take
+    the verdict of the last detected frame before them, and ranges shorter
+    than min_length frames are dropped.
+    """
+    measured = quality['detected'] >= 0
+    good = quality['detected'] == 1
+    checks = [
+        ('confidence', min_confidence, None),
+        ('blur', min_blur, None),
+        ('brightness', min_brightness, max_brightness),
+        ('mouth_visibility', min_mouth_visibility, None),
+        ('box_area', min_box_area, None),
+    ]
+    for name, low, high in checks:
+        values = quality[name]
+        if low is not None:
+            good &= values >= low
+        if high is not None:
+            good &= values <= high
+
+    # Carry each verdict forward over the frames the detector skipped
+    last_measured = np.maximum.accumulate(np.where(measured, np.arange(len(good)), -1))
+    good = np.where(last_measured >= 0, good[np.maximum(last_measured, 0)], False)
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], good.astype(np.int8), [0]))))
+    return [(int(start), int(end)) for start, end in zip(edges[::2], edges[1::2]) if end - start >= min_length]
+
+def render_face_track(input_video_path, output_video_path, track, target_size=512, target_fps=25,
+                      queue_size=DEFAULT_QUEUE_SIZE, encoder="x264", preset=DEFAULT_X264_PRESET,
+                      crf=DEFAULT_X264_CRF, threads=0):
+    """
+    Second pass: crop the frames of a video to a target_size square centered on
+    their box in track, with a reader thread decoding and a writer thread
+    encoding while the crops are taken. Frames without a box get a central crop.
+
+    The video is resampled to target_fps by timestamp: frames it drops are
+    never converted or cropped, and frames are repeated when target_fps is
+    higher than the source's. encoder="x264" pipes the crops into ffmpeg's
+    libx264 (preset, crf, threads), "mp4v" writes them with OpenCV's
+    single-threaded MPEG-4 Part 2 encoder.
+    """
     # Initialize video capture
-    cap = cv2.VideoCapture(input_video_path)
+    cap, rotation = open_upright_capture(input_video_path)
     if not cap.isOpened():
         print(f"Error: Could not open video {input_video_path}")
         return
 
-    original_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    original_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     original_fps = cap.get(cv2.CAP_PROP_FPS)
+    resampler = FrameResampler(target_fps, original_fps)
 
-    # Define the codec and create VideoWriter object
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_video_path, fourcc, target_fps, (target_size, target_size))
+    if encoder == "x264":
+        command = build_x264_pipe_command(output_video_path, target_size, target_fps, preset, crf, threads)
+        encoder_process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        write = lambda frame: encoder_process.stdin.write(frame.tobytes())
+    else:
+        # Define the codec and create VideoWriter object
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(output_video_path, fourcc, target_fps, (target_size, target_size))
+        write = out.write
 
-    with mp_face_detection.FaceDetection(
-        model_selection=0, min_detection_confidence=0.6) as face_detection:
-        frame_count = 0
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            # Convert the BGR image to RGB.
-            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # To improve performance, optionally mark the image as not writeable to pass by reference.
-            image_rgb.flags.writeable = False
-            results = face_detection.process(image_rgb)
-            image_rgb.flags.writeable = True
-
-            cropped_frame = None
-            if results.detections:
-                # Assuming only one face for simplicity, or pick the largest
-                detection = results.detections[0]
-                bbox_norm = detection.location_data.relative_bounding_box
-
-                # Convert normalized bounding box to pixel coordinates
-                x_min = int(bbox_norm.xmin * original_width)
-                y_min = int(bbox_norm.ymin * original_height)
-                width = int(bbox_norm.width * original_width)
-                height = int(bbox_norm.height * original_height)
-
-                # Calculate center of the face
-                face_center_x = x_min + width // 2
-                face_center_y = y_min + height // 2
-
-                # Calculate crop boundaries to center the face
-                crop_x1 = max(0, face_center_x - target_size // 2)
-                crop_y1 = max(0, face_center_y - target_size // 2)
-                crop_x2 = min(original_width, face_center_x + target_size // 2)
-                crop_y2 = min(original_height, face_center_y + target_size // 2)
-
-                # Adjust if crop goes out of bounds at the edges
-                if crop_x2 - crop_x1 < target_size:
-                    if crop_x1 == 0:
-                        crop_x2 = target_size
-                    elif crop_x2 == original_width:
-                        crop_x1 = original_width - target_size
-
-                if crop_y2 - crop_y1 < target_size:
-                    if crop_y1 == 0:
-                        crop_y2 = target_size
-                    elif crop_y2 == original_height:
-                        crop_y1 = original_height - target_size
-
-                # Ensure the final crop size is exactly target_size
-                crop_x2 = crop_x1 + target_size
-                crop_y2 = crop_y1 + target_size
-
-                # Perform the crop
-                cropped_frame = frame[crop_y1:crop_y2, crop_x1:crop_x2]
-
-                # Resize if the cropped frame is not exactly target_size (e.g., at edges)
-                if cropped_frame.shape[0] != target_size or cropped_frame.shape[1] != target_size:
-                    cropped_frame = cv2.resize(cropped_frame, (target_size, target_size))
+    frame_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    write_errors = []
+    reader = threading.Thread(target=read_frames, args=(cap, frame_queue, stop_event, resampler, rotation), daemon=True)
+    writer = threading.Thread(target=write_frames, args=(write, write_queue, stop_event, write_errors), daemon=True)
+    reader.start()
+    writer.start()
 
-            else:
-                # If no face is detected, you might choose to:
-                # 1. Skip the frame
-                # 2. Crop from the center of the original frame (fallback)
-                # 3. Use the last known face position
-                # For this example, we'll just center crop if no face detected
-                print(f"Warning: No face detected in frame {frame_count}. Applying central crop.")
-                center_x = original_width // 2
-                center_y = original_height // 2
-                crop_x1 = max(0, center_x - target_size // 2)
-                crop_y1 = max(0, center_y - target_size // 2)
-                cropped_frame = frame[crop_y1 : crop_y1 + target_size, crop_x1 : crop_x1 + target_size]
-                if cropped_frame.shape[0] != target_size or cropped_frame.shape[1] != target_size:
-                    cropped_frame = cv2.resize(cropped_frame, (target_size, target_size))
-
-
-            if cropped_frame is not None:
-                out.write(cropped_frame)
-            frame_count += 1
+    frame_count = 0
+    try:
+        while not stop_event.is_set():
+            try:
+                item = frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            index, frame, count, _ = item
+            if frame is None:
+                continue
+            box = track[index] if index < len(track) else None
+            if box is None or np.isnan(box[0]):
+                print(f"Warning: No face detected in frame {index}. Applying central crop.")
+                box = None
+            cropped_frame = crop_frame(frame, box, target_size)
+            for _ in range(count):
+                # Gives up once the writer has failed and set stop_event
+                if not put_until_stopped(write_queue, cropped_frame, stop_event):
+                    break
+            frame_count += count
+    finally:
+        stop_event.set()
+        # The writer drains what is queued and stops at None; a failed writer has already exited
+        while writer.is_alive():
+            try:
+                write_queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        writer.join()
+        reader.join()
 
     cap.release()
-    out.release()
-    cv2.destroyAllWindows()
+    if write_errors:
+        if encoder == "x264":
+            encoder_process.kill()
+            encoder_process.wait()
+        else:
+            out.release()
+        raise write_errors[0]
+    if encoder == "x264":
+        encoder_process.stdin.close()
+        if encoder_process.wait() != 0:
+            print(f"Error: ffmpeg failed to encode {output_video_path} (exit code {encoder_process.returncode})")
+            return
+    else:
+        out.release()
+    print(f"Wrote {frame_count} frames at {target_fps} fps (source: {original_fps:.2f} fps)")
     print(f"Processed video saved to {output_video_path}")
 
-#Usage:
-crop_and_center_face('videos/20250429_115126.mp4', 'videos/xest1.mp4', target_size=512, target_fps=25)
\ No newline at end of file
+def crop_and_center_face(input_video_path, output_video_path, target_size=512, target_fps=25,
+                         workers=None, queue_size=DEFAULT_QUEUE_SIZE, detect_every=1,
+                         motion_threshold=DEFAULT_MOTION_THRESHOLD, smooth=None,
+                         detection_size=DEFAULT_DETECTION_SIZE, track_dir=FACE_TRACK_DIR, encoder="x264", preset=DEFAULT_X264_PRESET, crf=DEFAULT_X264_CRF, threads=0):
+    """
+    Crop every frame of a video to a target_size square centered on the face.
+
+    Runs in two passes: detect_face_track() finds the face box of every frame
+    and stores the track, with its per-frame quality index for dataset
+    curation (load_face_quality, good_frame_segments), in track_dir, then
+    render_face_track() crops and encodes. Re-cropping the same video at
+    another target_size or target_fps (or after a failed write) only costs
+    a decode and an encode. See detect_face_track() for the detection options
+    and render_face_track() for the encoder options.
+    """
+    track = load_face_track(input_video_path, track_dir, workers=workers, queue_size=queue_size,
+                            detect_every=detect_every, motion_threshold=motion_threshold,
+                            smooth=smooth, detection_size=detection_size)
+    if track is None:
+        return
+    render_face_track(input_video_path, output_video_path, track, target_size, target_fps, queue_size,
+                      encoder, preset, crf, threads)
+
+if __name__ == "__main__":
+    #Usage:
+    crop_and_center_face('videos/20250429_115126.mp4', 'videos/xest1.mp4', target_size=512, target_fps=25)
@@ -1,5 +1,11 @@
 import os
+import hashlib
 import subprocess
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from audio_cache import AudioCache, CacheEntryEvicted, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from translation_memory import TranslationMemory
 # whisper import moved to legacy functions where it's actually needed
 # translate import moved to legacy functions where it's actually needed
 import sys
@@ -33,58 +39,313 @@ def get_video_files(video_folder="testing_videos"):
     
     return sorted(video_files)
 
-def extract_audio_from_video(video_path, output_folder="testing_audios/extracted"):
+# ffmpeg output options for ASR audio; also part of the extraction cache key
+AUDIO_EXTRACTION_PARAMS = [
+    '-vn',  # No video
+    '-acodec', 'pcm_s16le',  # Audio codec
+    '-ar', '16000',  # Sample rate
+    '-ac', '1',  # Number of channels
+]
+
+_default_cache = None
+
+def get_default_cache():
+    """Return the shared extraction cache, opening it on first use"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AudioCache(DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES)
+    return _default_cache
+
+# Derived outputs that can be produced from one decode of a source video.
+# Each entry: default output folder, file extension and ffmpeg output options.
+DERIVED_OUTPUTS = {
+    # 16 kHz mono WAV read by the ASR backends
+    'asr_wav': ("testing_audios/extracted", ".wav", AUDIO_EXTRACTION_PARAMS),
+    # Full-quality MP3 (the final.ipynb extract_audio_ffmpeg settings)
+    'full_mp3': ("neura/audio_mp3", ".mp3", ['-vn', '-q:a', '0']),
+    # Full-rate WAV that editing.split_video_on_silence analyses
+    'full_wav': ("full_length_extracted_audios", ".wav", ['-vn', '-acodec', 'pcm_s16le']),
+    # Square 512x512 25 fps center crop, the video_crop_ft fallback framing
+    'center_crop': ("cropped_videos", ".mp4", [
+        '-an',
+        '-vf', 'crop=min(iw\\,ih):min(iw\\,ih),scale=512:512',
+        '-r', '25',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18',
+    ]),
+}
+
+# Times an output is re-extracted when parallel workers evict its cache entry
+# between lookup and use
+MATERIALIZE_ATTEMPTS = 3
+
+def build_audio_extraction_command(video_path, output_path):
+    """Build the ffmpeg command used to extract 16 kHz mono WAV audio"""
+    return build_fanout_command(video_path, [(AUDIO_EXTRACTION_PARAMS, output_path)])
+
+def build_fanout_command(video_path, targets):
+    """
+    Build one ffmpeg command that decodes video_path once and writes every
+    (params, output_path) target. Outputs reading the same input stream
+    share its decoder, so the source is demuxed and decoded a single time.
+    """
+    command = [
+        'ffmpeg',
+        '-nostdin',  # Never read from the terminal (matters when running in parallel)
+        '-i', video_path,
+    ]
+    for params, output_path in targets:
+        command.extend(params)
+        command.extend(['-y', output_path])  # Overwrite output files
+    return command
+
+def get_audio_output_path(video_path, output_folder="testing_audios/extracted", suffix=''):
+    """Return the WAV path that extract_audio_from_video writes for a video"""
+    return get_derived_output_path(video_path, 'asr_wav', output_folder, suffix)
+
+def get_derived_output_path(video_path, output_name, output_folder=None, suffix=''):
+    """Return where a DERIVED_OUTPUTS entry is written for a video, suffix is appended to the video's name"""
+    default_folder, extension, _ = DERIVED_OUTPUTS[output_name]
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.normpath(os.path.join(output_folder or default_folder, video_name + suffix + extension))
+
+def source_path_suffix(video_path):
+    """Short, stable suffix telling apart videos that share a basename in different folders"""
+    return "_" + hashlib.sha256(os.path.abspath(video_path).encode('utf-8')).hexdigest()[:8]
+
+def output_suffixes(video_files):
+    """
+    Map every video to the suffix of its output names: '' unless several
+    videos share a basename (case-insensitively), then each of them gets its
+    source_path_suffix() so none overwrites another, whatever their order.
+    """
+    by_name = {}
+    for video_path in video_files:
+        name = os.path.splitext(os.path.basename(video_path))[0].lower()
+        by_name.setdefault(name, set()).add(os.path.abspath(video_path))
+    return {video_path: source_path_suffix(video_path)
+            if len(by_name[os.path.splitext(os.path.basename(video_path))[0].lower()]) > 1 else ''
+            for video_path in video_files}
+
+def extract_derived_cached(video_path, outputs, cache, timeout=None):
     """
-    Extract audio from video using FFmpeg and save to specified folder
+    Produce several derived outputs of video_path through the extraction cache.
+    All cache misses are written by a single ffmpeg run. Raises on failure.
+
+    Args:
+        video_path (str): Source video.
+        outputs (dict): Maps DERIVED_OUTPUTS names to output paths.
+        cache (AudioCache): Extraction cache.
+        timeout (float): Seconds before ffmpeg is killed.
+
+    Returns:
+        dict: Maps each output name to 'up-to-date', 'cached' or 'extracted'.
+    """
+    keys = {}
+    cached_paths = {}
+    statuses = {}
+    for output_name in outputs:
+        _, extension, params = DERIVED_OUTPUTS[output_name]
+        keys[output_name] = cache.key_for(video_path, params)
+        cached_paths[output_name] = cache.lookup(keys[output_name], extension)
+        statuses[output_name] = 'cached'
+
+    pending = dict(outputs)
+    for attempt in range(MATERIALIZE_ATTEMPTS):
+        _extract_missing(video_path, pending, keys, cached_paths, statuses, cache, timeout)
+        evicted = {}
+        for output_name, output_path in pending.items():
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            try:
+                updated = cache.materialize(keys[output_name], cached_paths[output_name], output_path, video_path)
+            except CacheEntryEvicted:
+                # Evicted by a parallel worker since lookup(): extract it again
+                cached_paths[output_name] = None
+                evicted[output_name] = output_path
+                continue
+            if not updated and statuses[output_name] == 'cached':
+                statuses[output_name] = 'up-to-date'
+        if not evicted:
+            return statuses
+        pending = evicted
+    raise CacheEntryEvicted(f"{', '.join(pending)} of {video_path} kept being evicted from the cache")
+
+def _extract_missing(video_path, outputs, keys, cached_paths, statuses, cache, timeout):
+    """Write every output without a cached file with one ffmpeg run and store it in the cache"""
+    missing = [name for name in outputs if cached_paths[name] is None]
+    if missing:
+        staged_paths = {name: cache.staging_path(keys[name], DERIVED_OUTPUTS[name][1]) for name in missing}
+        targets = [(DERIVED_OUTPUTS[name][2], staged_paths[name]) for name in missing]
+        command = build_fanout_command(os.path.normpath(video_path), targets)
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True,
+                           stdin=subprocess.DEVNULL, timeout=timeout)
+        except BaseException:
+            # Never let a partial file reach the cache
+            for staged_path in staged_paths.values():
+                if os.path.exists(staged_path):
+                    os.remove(staged_path)
+            raise
+        for name in missing:
+            cached_paths[name] = cache.store(keys[name], staged_paths[name], DERIVED_OUTPUTS[name][1])
+            statuses[name] = 'extracted'
+
+def extract_audio_cached(video_path, output_path, cache, timeout=None):
+    """
+    Produce output_path for video_path through the extraction cache.
+    Runs ffmpeg only on a cache miss. Raises on failure.
+
+    Returns:
+        str: 'up-to-date' if output_path already held this audio,
+             'cached' if it was restored from the cache,
+             'extracted' if ffmpeg had to run.
+    """
+    return extract_derived_cached(video_path, {'asr_wav': output_path}, cache, timeout)['asr_wav']
+
+def extract_audio_from_video(video_path, output_folder="testing_audios/extracted", timeout=None, cache=None):
+    """
+    Extract audio from video using FFmpeg and save to specified folder.
+    Results are served from the content-addressed extraction cache when possible.
     """
     try:
         # Ensure output folder exists
         os.makedirs(output_folder, exist_ok=True)
+        cache = cache or get_default_cache()
         
         # Get video filename without extension
         video_filename = os.path.basename(video_path)
-        video_name = os.path.splitext(video_filename)[0]
-        
-        # Create output audio path
-        audio_filename = f"{video_name}.wav"
-        output_path = os.path.join(output_folder, audio_filename)
+        audio_filename = os.path.splitext(video_filename)[0] + ".wav"
         
         # Normalize paths for the operating system
         video_path = os.path.normpath(video_path)
-        output_path = os.path.normpath(output_path)
-        
-        # Skip if audio already exists
-        if os.path.exists(output_path):
-            print(f"Audio already exists: {output_path}")
-            return output_path
+        output_path = get_audio_output_path(video_path, output_folder)
         
         print(f"Extracting audio from: {video_filename}")
         print(f"Output: {output_path}")
         
-        command = [
-            'ffmpeg',
-            '-i', video_path,
-            '-vn',  # No video
-            '-acodec', 'pcm_s16le',  # Audio codec
-            '-ar', '16000',  # Sample rate
-            '-ac', '1',  # Number of channels
-            '-y',  # Overwrite output files
-            output_path
-        ]
-        
-        # Run ffmpeg with minimal output
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        print(f"[OK] Audio extracted successfully: {audio_filename}")
+        status = extract_audio_cached(video_path, output_path, cache, timeout)
+        if status == 'up-to-date':
+            print(f"Audio already up to date: {output_path}")
+        elif status == 'cached':
+            print(f"[OK] Audio restored from cache: {audio_filename}")
+        else:
+            print(f"[OK] Audio extracted successfully: {audio_filename}")
         return output_path
         
     except subprocess.CalledProcessError as e:
         print(f"[ERROR] Error extracting audio from {video_path}: {e}")
         print(f"FFmpeg stderr: {e.stderr}")
         return None
+    except subprocess.TimeoutExpired as e:
+        print(f"[ERROR] Timed out extracting audio from {video_path} after {e.timeout} seconds")
+        return None
     except Exception as e:
         print(f"[ERROR] Unexpected error extracting audio from {video_path}: {e}")
         return None
 
+def extract_audio_job(video_path, output_folder="testing_audios/extracted", timeout=None, cache=None,
+                      extra_outputs=(), suffix=''):
+    """
+    Extract audio for one video without printing, for use from a worker pool.
+    Names in extra_outputs (keys of DERIVED_OUTPUTS) are written by the same
+    ffmpeg decode to their default folders. suffix is appended to the output
+    names (see output_suffixes).
+    Returns a dict with the output path, elapsed seconds and error (if any).
+    """
+    start_time = time.perf_counter()
+    job = {'video': video_path, 'output': None, 'skipped': False, 'seconds': 0.0, 'error': None}
+    output_path = get_audio_output_path(video_path, output_folder, suffix)
+    outputs = {'asr_wav': output_path}
+    for output_name in extra_outputs:
+        outputs[output_name] = get_derived_output_path(video_path, output_name, suffix=suffix)
+    try:
+        statuses = extract_derived_cached(video_path, outputs, cache or get_default_cache(), timeout)
+        job['output'] = output_path
+        job['skipped'] = 'extracted' not in statuses.values()
+    except subprocess.CalledProcessError as e:
+        stderr_lines = (e.stderr or '').strip().splitlines()
+        job['error'] = f"ffmpeg exited with code {e.returncode}: {stderr_lines[-1] if stderr_lines else 'no stderr'}"
+    except subprocess.TimeoutExpired as e:
+        job['error'] = f"timed out after {e.timeout} seconds"
+    except Exception as e:
+        job['error'] = str(e)
+    job['seconds'] = time.perf_counter() - start_time
+    return job
+
+def extract_audio_batch(video_files, output_folder="testing_audios/extracted", jobs=None, timeout=600, cache=None,
+                        extra_outputs=()):
+    """
+    Extract audio from many videos with a bounded pool of ffmpeg workers.
+
+    Args:
+        video_files (list): Paths of the videos to process.
+        output_folder (str): Folder for the extracted WAV files.
+        jobs (int): Number of ffmpeg processes to run at once (default: CPU count).
+        timeout (float): Seconds after which a single extraction is killed (None to disable).
+        cache (AudioCache): Extraction cache to use (default: the shared cache).
+        extra_outputs (list): DERIVED_OUTPUTS names written in the same decode.
+
+    Returns:
+        tuple: (results, failures) - lists of job dicts from extract_audio_job,
+               in the same order as video_files.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    cache = cache or get_default_cache()
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    jobs_by_video = {}
+
+    # Videos sharing a basename get distinct output names; the same video listed twice is done once
+    suffixes = output_suffixes(video_files)
+    first_listing = {}
+    for video_path in video_files:
+        first_listing.setdefault(os.path.abspath(video_path), video_path)
+    to_extract = list(first_listing.values())
+    total = len(to_extract)
+    for video_path in to_extract:
+        if suffixes[video_path]:
+            print(f"  {video_path} shares its name with another video, "
+                  f"writing {os.path.basename(get_audio_output_path(video_path, output_folder, suffixes[video_path]))}")
+
+    print(f"Extracting audio with {jobs} parallel job(s), timeout {timeout}s per file")
+    start_time = time.perf_counter()
+
+    # ffmpeg does the work in its own process, so threads are enough to keep N of them busy
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(extract_audio_job, video_path, output_folder, timeout, cache, extra_outputs,
+                                   suffixes[video_path]): video_path
+                   for video_path in to_extract}
+        for done, future in enumerate(as_completed(futures), 1):
+            job = future.result()
+            jobs_by_video[futures[future]] = job
+            status = "ERROR" if job['error'] else ("CACHED" if job['skipped'] else "OK")
+            print(f"  [{done}/{total}] [{status}] {os.path.basename(job['video'])} ({job['seconds']:.2f}s)")
+
+    elapsed = time.perf_counter() - start_time
+    results = [jobs_by_video[first_listing[os.path.abspath(video_path)]] for video_path in video_files]
+    failures = [job for job in results if job['error']]
+
+    extracted = [jobs_by_video[video_path] for video_path in to_extract]
+    print_extraction_summary(extracted, [job for job in extracted if job['error']], elapsed)
+    return results, failures
+
+def print_extraction_summary(results, failures, elapsed):
+    """Print per-file timings and the collected failures of an extraction batch"""
+    print(f"\n{'='*70}")
+    print("AUDIO EXTRACTION SUMMARY")
+    print('='*70)
+    for job in results:
+        status = "ERROR" if job['error'] else ("CACHED" if job['skipped'] else "OK")
+        print(f"  {job['seconds']:8.2f}s  [{status}]  {os.path.basename(job['video'])}")
+
+    busy_time = sum(job['seconds'] for job in results)
+    print(f"\nWall time: {elapsed:.2f}s, summed job time: {busy_time:.2f}s")
+    if elapsed > 0:
+        print(f"Effective speed-up over serial: {busy_time / elapsed:.2f}x")
+
+    if failures:
+        print(f"\n{len(failures)} file(s) failed:")
+        for job in failures:
+            print(f"  [ERROR] {job['video']}: {job['error']}")
+
 def run_neura_transcription(audio_folder="testing_audios/extracted", output_file="testing_transcribe.txt"):
     """
     Run neura_ASR.py to transcribe audio files
@@ -156,23 +417,18 @@ def run_translation(input_file="testing_transcribe.txt", output_folder="testing_
         
         print(f"Translating {input_file}...")
         
-        # Translate to each target language
+        # Translate to all target languages at once
         languages = translate_module.languages
-        translate_file_func = translate_module.translate_file
+        output_files = {lang_code: os.path.join(output_folder, f"{lang_code}_translation.txt")
+                        for lang_code in languages}
+        print(f"  Translating to {', '.join(languages.values())}...")
         
-        for lang_code, lang_name in languages.items():
-            output_file = os.path.join(output_folder, f"{lang_code}_translation.txt")
-            print(f"  Translating to {lang_name}...")
-            
-            try:
-                # Use the translation function directly
-                result_file = translate_file_func(input_file, lang_code, lang_name, output_file)
-                if result_file:
-                    print(f"  [OK] Created {result_file}")
-                else:
-                    print(f"  [ERROR] Failed to create {output_file}")
-            except Exception as e:
-                print(f"  [ERROR] Error translating to {lang_name}: {e}")
+        results = translate_module.translate_languages(input_file, languages, output_files)
+        for lang_code, result_file in results.items():
+            if result_file:
+                print(f"  [OK] Created {result_file}")
+            else:
+                print(f"  [ERROR] Failed to create {output_files[lang_code]}")
         
         print("[OK] Translation process completed")
         return True
@@ -181,9 +437,15 @@ def run_translation(input_file="testing_transcribe.txt", output_folder="testing_
         print(f"[ERROR] Error in translation process: {e}")
         return False
 
-def process_videos_workflow():
+def process_videos_workflow(jobs=None, timeout=600, cache=None, extra_outputs=()):
     """
     Main workflow to process videos: extract audio, transcribe, and translate
+
+    Args:
+        jobs (int): Number of parallel ffmpeg audio extractions (default: CPU count).
+        timeout (float): Per-file extraction timeout in seconds.
+        cache (AudioCache): Extraction cache to use (default: the shared cache).
+        extra_outputs (list): DERIVED_OUTPUTS names to produce alongside the ASR audio.
     """
     print("INTEGRATED VIDEO PROCESSING WORKFLOW")
     print("="*70)
@@ -207,13 +469,9 @@ def process_videos_workflow():
     
     # Step 3: Extract audio from all videos
     print(f"\nStep 3: Extracting audio from {len(video_files)} videos...")
-    extracted_count = 0
-    
-    for i, video_path in enumerate(video_files, 1):
-        print(f"\n[{i}/{len(video_files)}] Processing: {os.path.basename(video_path)}")
-        audio_path = extract_audio_from_video(video_path)
-        if audio_path:
-            extracted_count += 1
+    results, failures = extract_audio_batch(video_files, jobs=jobs, timeout=timeout, cache=cache,
+                                             extra_outputs=extra_outputs)
+    extracted_count = len(results) - len(failures)
     
     print(f"\n[OK] Audio extraction completed: {extracted_count}/{len(video_files)} successful")
     
@@ -271,11 +529,18 @@ def transcribe_audio(audio_path, target_lang='sq'):
         print(f"Error transcribing audio: {e}")
         raise
 
-def translate_text(text, target_lang='en'):
+def translate_text(text, target_lang='en', memory=None):
     """
-    Translate text to target language using translate package
+    Translate text to target language using translate package. The
+    translation memory is checked first and remembers new translations.
     """
+    own_memory = memory is None
     try:
+        memory = memory or TranslationMemory()
+        translation = memory.lookup(text, 'auto', target_lang, 'translate')
+        if translation is not None:
+            return translation
+        
         # Import Translator only when this legacy function is used
         try:
             from translate import Translator
@@ -284,10 +549,14 @@ def translate_text(text, target_lang='en'):
         
         translator = Translator(to_lang=target_lang)
         translation = translator.translate(text)
+        memory.store(text, translation, 'auto', target_lang, 'translate')
         return translation
     except Exception as e:
         print(f"Error translating text: {e}")
         raise
+    finally:
+        if own_memory and memory is not None:
+            memory.close()
 
 def process_video(video_path, target_lang='sq'):
     """
@@ -327,15 +596,32 @@ def process_video(video_path, target_lang='sq'):
     
     return transcript, translated_text
 
-# if __name__ == "__main__":
-#     # Run the integrated workflow
-#     success = process_videos_workflow()
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Extract audio, transcribe and translate a folder of videos.')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='Number of parallel audio extractions (default: number of CPU cores)')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='Per-file audio extraction timeout in seconds (default: 600)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Extraction cache folder (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-max-gb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3,
+                        help='Maximum extraction cache size in GB before old entries are evicted')
+    parser.add_argument('--also', nargs='*', default=[], choices=[name for name in DERIVED_OUTPUTS if name != 'asr_wav'],
+                        help='Extra outputs written in the same ffmpeg decode as the ASR audio')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    # Run the integrated workflow
+    cache = AudioCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3))
+    success = process_videos_workflow(jobs=args.jobs, timeout=args.timeout, cache=cache,
+                                      extra_outputs=args.also)
     
-#     if not success:
-#         print("\nWorkflow failed. Please check the errors above.")
-#         sys.exit(1)
-#     else:
-#         print("\nWorkflow completed successfully!")
-#         sys.exit(0) 
-videos = []
-for video in 
\ No newline at end of file
+    if not success:
+        print("\nWorkflow failed. Please check the errors above.")
+        sys.exit(1)
+    else:
+        print("\nWorkflow completed successfully!")
+        sys.exit(0)
@@ -1,8 +1,17 @@
 # main.py
+import os
 import re
+import csv
+import json
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from collections import defaultdict
 
+import numpy as np
+
+from transcript_store import TranscriptStore
+
 def preprocess_text(text):
     "Changing numbers to letters if there are any"
     num_to_words_albanian = {
@@ -26,47 +35,221 @@ def preprocess_text(text):
     text = replace_numbers(text)
     return text.split()
 
-def calculate_wer(reference, hypothesis):
+# Backtrace moves of the WER engine, stored as two bit planes per DP row
+MATCH, SUBSTITUTION, INSERTION, DELETION = 0, 1, 2, 3
 
-    ref_len = len(reference)
-    hyp_len = len(hypothesis)
-    
-    # Using a 1D array for space optimization is possible, but for clarity and 
-    # backtracking to count S/D/I, a 2D matrix is simpler to understand.
-    dp = [[0] * (hyp_len + 1) for _ in range(ref_len + 1)]
-
-    for i in range(ref_len + 1):
-        for j in range(hyp_len + 1):
-            if i == 0:
-                dp[i][j] = j  # Deletions to match an empty reference
-            elif j == 0:
-                dp[i][j] = i  # Insertions to match an empty hypothesis
-            else:
-                cost = 0 if reference[i-1] == hypothesis[j-1] else 1
-                dp[i][j] = min(dp[i-1][j] + 1,        # Deletion
-                               dp[i][j-1] + 1,        # Insertion
-                               dp[i-1][j-1] + cost)  # Substitution
+# Below this many DP cells plain Python lists beat NumPy's per-row call overhead
+SMALL_DP_CELLS = 10000
+
+def words_to_ids(reference, hypothesis):
+    """Map the words of both texts to integer IDs (shared vocabulary) as NumPy arrays"""
+    vocabulary = {}
+    ref_ids = np.array([vocabulary.setdefault(word, len(vocabulary)) for word in reference], dtype=np.int32)
+    hyp_ids = np.array([vocabulary.setdefault(word, len(vocabulary)) for word in hypothesis], dtype=np.int32)
+    return ref_ids, hyp_ids
+
+def _window(values, values_start, start, length, fill):
+    """values (covering columns values_start...) seen through columns start..start+length-1, fill outside"""
+    out = np.full(length, fill, dtype=values.dtype)
+    lo = max(start, values_start)
+    hi = min(start + length, values_start + len(values))
+    if lo < hi:
+        out[lo - start:hi - start] = values[lo - values_start:hi - values_start]
+    return out
+
+def _edit_operations_small(ref_ids, hyp_ids, path=None):
+    """edit_operations() for short texts: the full DP in Python lists, same backtrace"""
+    ref_ids, hyp_ids = ref_ids.tolist(), hyp_ids.tolist()
+    n, m = len(ref_ids), len(hyp_ids)
+    dp = [list(range(m + 1))]
+    for i in range(1, n + 1):
+        prev = dp[-1]
+        row = [i] * (m + 1)
+        word = ref_ids[i - 1]
+        for j in range(1, m + 1):
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (word != hyp_ids[j - 1]))
+        dp.append(row)
 
-    # Backtrack to count S, D, I
     substitutions = deletions = insertions = 0
-    i, j = ref_len, hyp_len
-    while i > 0 or j > 0:
-        if i > 0 and j > 0 and reference[i-1] == hypothesis[j-1]:
-            i, j = i-1, j-1
-            continue
+    i, j = n, m
+    while i > 0 and j > 0:
+        if ref_ids[i - 1] == hyp_ids[j - 1]:
+            move = MATCH
+            i, j = i - 1, j - 1
+        elif dp[i][j] == dp[i - 1][j - 1] + 1:
+            move = SUBSTITUTION
+            substitutions += 1
+            i, j = i - 1, j - 1
+        elif dp[i][j] == dp[i][j - 1] + 1:
+            move = INSERTION
+            insertions += 1
+            j -= 1
+        else:
+            move = DELETION
+            deletions += 1
+            i -= 1
+        if path is not None:
+            path.append(move)
+    if path is not None:
+        path.extend([DELETION] * i + [INSERTION] * j)
+    return substitutions, deletions + i, insertions + j
+
+def edit_distance(reference, hypothesis):
+    """
+    Levenshtein distance between two sequences of hashable items, without the
+    S/D/I breakdown. Bit-parallel (Myers/Hyyrö): the DP column is kept as
+    Python int bit vectors, so the cost is len(hypothesis) word operations
+    on len(reference)-bit integers.
+    """
+    m = len(reference)
+    if m == 0:
+        return len(hypothesis)
+    peq = {}
+    for position, item in enumerate(reference):
+        peq[item] = peq.get(item, 0) | (1 << position)
+
+    mask = (1 << m) - 1
+    high_bit = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for item in hypothesis:
+        eq = peq.get(item, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high_bit:
+            score += 1
+        elif mh & high_bit:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+def edit_operations(ref_ids, hyp_ids, band=None, path=None):
+    """
+    Count the substitutions, deletions and insertions that turn ref_ids into hyp_ids.
+
+    The DP is filled one row at a time with NumPy: substitutions and deletions
+    come from the previous row, and the chain of insertions along the row is a
+    running minimum of (row - j) + j. Only the backtrace move of every cell is
+    kept, packed into two bits, and the S/D/I counts come from walking those
+    moves back from the end with the same tie-breaking as the original
+    list-of-lists implementation (match, substitution, insertion, deletion).
+
+    With band=k only cells with |i - j| <= k (k is raised to at least
+    |len(ref) - len(hyp)|) are computed, which is linear in time and memory
+    for near-matching texts. Any alignment with at most k errors stays
+    inside the band, so the result is exact whenever the banded distance is
+    at most k; otherwise the full DP is run instead.
+
+    If path is a list, the moves of the alignment are appended to it, last one first.
+
+    Returns (substitutions, deletions, insertions).
+    """
+    n, m = len(ref_ids), len(hyp_ids)
+    if n == 0 or m == 0:
+        if path is not None:
+            path.extend([DELETION] * n + [INSERTION] * m)
+        return 0, n, m
+    if n * m <= SMALL_DP_CELLS:
+        return _edit_operations_small(ref_ids, hyp_ids, path)
+    if band is not None:
+        band = max(band, abs(n - m))
+        if band >= max(n, m):
+            band = None
+
+    infinity = n + m + 1
+    prev_start, prev = 0, np.arange(m + 1 if band is None else min(m, band) + 1, dtype=np.int32)
+    # rows[i] = (first column, packed high bits, packed low bits) of the moves of row i
+    rows = [None]
+    for i in range(1, n + 1):
+        start = 0 if band is None else max(0, i - band)
+        stop = m if band is None else min(m, i + band)
+        length = stop - start + 1
+        columns = np.arange(start, stop + 1, dtype=np.int32)
+
+        up = _window(prev, prev_start, start, length, infinity)
+        diag = _window(prev, prev_start, start - 1, length, infinity)
+        # Column 0 has no hypothesis word, it can never match
+        words = _window(hyp_ids, 1, start, length, -1)
+        equal = words == ref_ids[i - 1]
+
+        row = np.minimum(up + 1, diag + (~equal))
+        row = np.minimum.accumulate(row - columns) + columns
+        left = np.concatenate(([infinity], row[:-1]))
 
-        if i > 0 and j > 0 and dp[i][j] == dp[i-1][j-1] + 1:
+        moves = np.where(equal, MATCH,
+                np.where(row == diag + 1, SUBSTITUTION,
+                np.where(row == left + 1, INSERTION, DELETION)))
+        if start == 0:
+            moves[0] = DELETION
+        rows.append((start, np.packbits(moves >> 1), np.packbits(moves & 1)))
+        prev_start, prev = start, row
+
+    distance = int(prev[m - prev_start])
+    if band is not None and distance > band:
+        # The optimal alignment may leave the band, redo it exactly
+        return edit_operations(ref_ids, hyp_ids, path=path)
+
+    substitutions = deletions = insertions = 0
+    i, j = n, m
+    while i > 0:
+        start, high_bits, low_bits = rows[i]
+        k = j - start
+        move = ((high_bits[k >> 3] >> (7 - (k & 7))) & 1) << 1 | ((low_bits[k >> 3] >> (7 - (k & 7))) & 1)
+        if move == MATCH:
+            i, j = i - 1, j - 1
+        elif move == SUBSTITUTION:
             substitutions += 1
-            i, j = i-1, j-1
-        elif j > 0 and dp[i][j] == dp[i][j-1] + 1:
+            i, j = i - 1, j - 1
+        elif move == INSERTION:
             insertions += 1
             j -= 1
-        elif i > 0 and dp[i][j] == dp[i-1][j] + 1:
+        else:
             deletions += 1
             i -= 1
-        else: # This case handles moving from (0,0)
-            break
-            
+        if path is not None:
+            path.append(move)
+    if path is not None:
+        path.extend([INSERTION] * j)
+    insertions += j
+    return substitutions, deletions, insertions
+
+def align_words(reference, hypothesis, band=None):
+    """
+    Word-level alignment behind calculate_wer(), as a list of (op, ref_word, hyp_word)
+    with op 'C' (correct), 'S', 'D' or 'I' and None for the missing side.
+    """
+    path = []
+    edit_operations(*words_to_ids(reference, hypothesis), band=band, path=path)
+    alignment = []
+    i = j = 0
+    for move in reversed(path):
+        if move == MATCH or move == SUBSTITUTION:
+            alignment.append(('C' if move == MATCH else 'S', reference[i], hypothesis[j]))
+            i, j = i + 1, j + 1
+        elif move == INSERTION:
+            alignment.append(('I', None, hypothesis[j]))
+            j += 1
+        else:
+            alignment.append(('D', reference[i], None))
+            i += 1
+    return alignment
+
+def calculate_wer(reference, hypothesis, band=None):
+    """
+    Word error rate of a hypothesis word list against a reference word list.
+    band limits the alignment to near-matching texts, see edit_operations().
+    Returns (wer, substitutions, deletions, insertions).
+    """
+    ref_len = len(reference)
+    hyp_len = len(hypothesis)
+
+    ref_ids, hyp_ids = words_to_ids(reference, hypothesis)
+    substitutions, deletions, insertions = edit_operations(ref_ids, hyp_ids, band)
+
     if ref_len == 0:
         wer = float('inf') if hyp_len > 0 else 0
     else:
@@ -76,96 +259,371 @@ def calculate_wer(reference, hypothesis):
 
 def parse_transcript_file(file_path):
     """
-    Parses a file with the format 'video_id:text' into a dictionary.
+    Opens a file with the format 'video_id:text' as an indexed TranscriptStore.
+    The index is kept in memory, so scoring never writes next to its inputs.
     
     Args:
         file_path (str): The path to the transcript file.
         
     Returns:
-        dict: A dictionary mapping video_id to its transcript.
+        TranscriptStore: A dict-like mapping of video_id to its transcript.
     """
-    transcripts = {}
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if ':' in line:
-                    # Split only on the first colon to handle colons in the text
-                    video_id, text = line.split(':', 1)
-                    transcripts[video_id.strip()] = text.strip()
+        return TranscriptStore(file_path, index_path=":memory:", create=False)
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
         return None
     except Exception as e:
         print(f"An error occurred while reading {file_path}: {e}")
         return None
-        
-    return transcripts
 
-def main(ref_file_path, hyp_file_path):
-    # Parse both files into dictionaries
-    reference_transcripts = parse_transcript_file(ref_file_path)
-    hypothesis_transcripts = parse_transcript_file(hyp_file_path)
+# Report columns of evaluate_corpus(), one row per matched video_id
+REPORT_FIELDS = ['video_id', 'ref_words', 'hyp_words', 'substitutions', 'deletions', 'insertions', 'wer',
+                 'ref_chars', 'char_errors', 'cer']
 
-    if reference_transcripts is None or hypothesis_transcripts is None:
-        print("Could not proceed due to file reading errors.")
-        return
+def score_pair(task):
+    """
+    Worker: score one (video_id, reference, hyp_text, band, align) task. reference
+    is the raw text or its already preprocessed word list. CER is the
+    bit-parallel edit distance of the preprocessed words joined by single
+    spaces. With align, the row also holds the word alignment (align_words).
+    """
+    video_id, reference, hyp_text, band, align = task
+    reference_words = reference if isinstance(reference, list) else preprocess_text(reference)
+    hypothesis_words = preprocess_text(hyp_text)
+    wer, s, d, i = calculate_wer(reference_words, hypothesis_words, band)
 
-    total_substitutions = 0
-    total_deletions = 0
-    total_insertions = 0
-    total_reference_words = 0
-    matched_files_count = 0
+    ref_chars = ' '.join(reference_words)
+    hyp_chars = ' '.join(hypothesis_words)
+    char_errors = edit_distance(ref_chars, hyp_chars)
+    cer = char_errors / len(ref_chars) if ref_chars else (float('inf') if hyp_chars else 0)
 
-    print("-" * 50)
-    print("Individual File WER Calculation:")
-    print("-" * 50)
+    row = {
+        'video_id': video_id,
+        'ref_words': len(reference_words),
+        'hyp_words': len(hypothesis_words),
+        'substitutions': s,
+        'deletions': d,
+        'insertions': i,
+        'wer': wer,
+        'ref_chars': len(ref_chars),
+        'char_errors': char_errors,
+        'cer': cer,
+    }
+    if align:
+        row['alignment'] = align_words(reference_words, hypothesis_words, band)
+    return row
+
+def bootstrap_resamples(n, replicates, seed=0):
+    """
+    Yield arrays of file indices, one resample of n files with replacement per
+    row, in chunks of about 4M indices to bound memory on large corpora.
+    The same seed gives the same resamples, which pairs systems up.
+    """
+    rng = np.random.default_rng(seed)
+    chunk = max(1, 4_000_000 // n)
+    for start in range(0, replicates, chunk):
+        yield rng.integers(0, n, size=(min(chunk, replicates - start), n))
+
+def bootstrap_ci(errors, totals, replicates=1000, confidence=0.95, seed=0):
+    """
+    Percentile bootstrap confidence interval of the corpus error rate
+    sum(errors) / sum(totals), resampling files with replacement.
+    """
+    errors = np.asarray(errors, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    n = len(errors)
+    if n == 0 or replicates <= 0 or totals.sum() == 0:
+        return (float('nan'), float('nan'))
+
+    rates = []
+    for picks in bootstrap_resamples(n, replicates, seed):
+        sampled_totals = totals[picks].sum(axis=1)
+        rates.append(np.divide(errors[picks].sum(axis=1), sampled_totals,
+                               out=np.full(len(picks), np.nan), where=sampled_totals > 0))
+    alpha = (1 - confidence) / 2
+    low, high = np.nanquantile(np.concatenate(rates), [alpha, 1 - alpha])
+    return (float(low), float(high))
 
-    # Iterate through the ground truth file to find matches
+def iter_scores(tasks, jobs=None):
+    """
+    Score score_pair() tasks on a process pool, yielding results in task
+    order; a result that finishes early waits until the ones before it are done.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) < 2:
+        yield from map(score_pair, tasks)
+        return
+    # Large chunks keep the per-task IPC cost low for short utterances
+    chunksize = max(1, min(256, len(tasks) // (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(score_pair, tasks, chunksize=chunksize)
+
+def evaluate_corpus(reference_transcripts, hypothesis_transcripts, jobs=None, band=None, report_path=None,
+                    bootstrap=1000, confidence=0.95, verbose=True):
+    """
+    Score every video_id present in both transcript dicts in parallel.
+
+    Per-file rows are streamed to report_path in task order when it ends with
+    .csv (REPORT_FIELDS); with any other extension a JSON document holding the
+    rows and the summary is written at the end. The summary has corpus
+    S/D/I, WER and CER with percentile bootstrap confidence intervals over
+    files. Returns (rows, summary).
+    """
+    tasks = []
+    missing = []
     for video_id, ref_text in reference_transcripts.items():
         if video_id in hypothesis_transcripts:
-            hyp_text = hypothesis_transcripts[video_id]
-            matched_files_count += 1
-
-            # Preprocess both texts
-            reference_words = preprocess_text(ref_text)
-            hypothesis_words = preprocess_text(hyp_text)
-            
-            # Calculate WER for the current pair
-            wer, s, d, i = calculate_wer(reference_words, hypothesis_words)
-            
-            # Aggregate totals for overall calculation
-            total_substitutions += s
-            total_deletions += d
-            total_insertions += i
-            total_reference_words += len(reference_words)
-            
-            print(f"File: {video_id}")
-            print(f"  - WER: {wer:.2%}, S: {s}, D: {d}, I: {i}\n")
+            tasks.append((video_id, ref_text, hypothesis_transcripts[video_id], band, False))
         else:
+            missing.append(video_id)
+
+    csv_file = writer = None
+    if report_path and report_path.lower().endswith('.csv'):
+        csv_file = open(report_path, 'w', newline='', encoding='utf-8')
+        writer = csv.DictWriter(csv_file, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+
+    started = time.time()
+    rows = []
+    try:
+        for row in iter_scores(tasks, jobs):
+            rows.append(row)
+            if writer:
+                writer.writerow(row)
+            if verbose:
+                print(f"File: {row['video_id']}")
+                print(f"  - WER: {row['wer']:.2%}, S: {row['substitutions']}, D: {row['deletions']}, "
+                      f"I: {row['insertions']}, CER: {row['cer']:.2%}\n")
+    finally:
+        if csv_file:
+            csv_file.close()
+
+    if verbose:
+        for video_id in missing:
             print(f"File: {video_id} (Not found in hypothesis file, skipping)\n")
 
-    # Calculate overall WER
-    if total_reference_words > 0:
-        overall_wer = (total_substitutions + total_deletions + total_insertions) / total_reference_words
-    else:
-        overall_wer = 0.0
+    summary = summarize_scores(rows, bootstrap, confidence)
+    summary['files_missing'] = len(missing)
+    summary['seconds'] = round(time.time() - started, 3)
+
+    if report_path and not writer:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'files': rows}, f, ensure_ascii=False, indent=2)
+    return rows, summary
+
+def summarize_scores(rows, bootstrap=1000, confidence=0.95):
+    """Corpus S/D/I, WER and CER of score_pair() rows, with bootstrap confidence intervals"""
+    word_errors = [row['substitutions'] + row['deletions'] + row['insertions'] for row in rows]
+    ref_words = [row['ref_words'] for row in rows]
+    char_errors = [row['char_errors'] for row in rows]
+    ref_chars = [row['ref_chars'] for row in rows]
+    total_words = sum(ref_words)
+    total_chars = sum(ref_chars)
+    return {
+        'files_matched': len(rows),
+        'ref_words': total_words,
+        'substitutions': sum(row['substitutions'] for row in rows),
+        'deletions': sum(row['deletions'] for row in rows),
+        'insertions': sum(row['insertions'] for row in rows),
+        'wer': sum(word_errors) / total_words if total_words else 0.0,
+        'wer_ci': bootstrap_ci(word_errors, ref_words, bootstrap, confidence),
+        'ref_chars': total_chars,
+        'char_errors': sum(char_errors),
+        'cer': sum(char_errors) / total_chars if total_chars else 0.0,
+        'cer_ci': bootstrap_ci(char_errors, ref_chars, bootstrap, confidence),
+        'confidence': confidence,
+    }
+
+def paired_bootstrap_test(errors_a, errors_b, totals, replicates=1000, seed=0):
+    """
+    Paired bootstrap significance test of the corpus WER difference between two
+    systems scored on the same files. Returns (wer_a - wer_b, two-sided p-value).
+    """
+    errors_a = np.asarray(errors_a, dtype=np.float64)
+    errors_b = np.asarray(errors_b, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    if len(totals) == 0 or totals.sum() == 0:
+        return (0.0, 1.0)
+    delta = (errors_a.sum() - errors_b.sum()) / totals.sum()
+    if replicates <= 0:
+        return (float(delta), float('nan'))
+
+    not_above = not_below = 0
+    for picks in bootstrap_resamples(len(totals), replicates, seed):
+        difference = errors_a[picks].sum(axis=1) - errors_b[picks].sum(axis=1)
+        not_above += int((difference <= 0).sum())
+        not_below += int((difference >= 0).sum())
+    p_value = min(1.0, 2 * min(not_above, not_below) / replicates)
+    return (float(delta), p_value)
+
+def compare_systems(reference_transcripts, systems, jobs=None, band=None, report_path=None,
+                    bootstrap=1000, confidence=0.95, align=False):
+    """
+    Score several ASR systems against one reference in a single parallel run.
+
+    systems maps a system name to its hypothesis transcripts. The reference is
+    preprocessed once, and only video_ids present in the reference and in every
+    system are scored, so all systems are compared on the same files. Every
+    pair of systems gets a paired bootstrap test of its WER difference.
+    With align, the per-word alignment of every file and system is kept too.
+
+    report_path gets a JSON document (summaries, significance, per-file rows)
+    or, if it ends with .csv, a side-by-side table of per-file WER.
+    Returns (rows by system, summaries by system, significance list).
+    """
+    names = list(systems)
+    common = [video_id for video_id in reference_transcripts
+              if all(video_id in systems[name] for name in names)]
+    reference_words = {video_id: preprocess_text(reference_transcripts[video_id]) for video_id in common}
+
+    tasks = [(video_id, reference_words[video_id], systems[name][video_id], band, align)
+             for name in names for video_id in common]
+    started = time.time()
+    scores = list(iter_scores(tasks, jobs))
+    rows = {name: scores[k * len(common):(k + 1) * len(common)] for k, name in enumerate(names)}
+
+    summaries = {}
+    for name in names:
+        summaries[name] = summarize_scores(rows[name], bootstrap, confidence)
+        summaries[name]['files_skipped'] = len(systems[name]) - len(common)
+
+    totals = [len(reference_words[video_id]) for video_id in common]
+    errors = {name: [row['substitutions'] + row['deletions'] + row['insertions'] for row in rows[name]]
+              for name in names}
+    significance = []
+    for a in range(len(names)):
+        for b in range(a + 1, len(names)):
+            delta, p_value = paired_bootstrap_test(errors[names[a]], errors[names[b]], totals, bootstrap)
+            significance.append({'a': names[a], 'b': names[b], 'wer_delta': delta, 'p_value': p_value})
+    seconds = round(time.time() - started, 3)
+
+    if report_path and report_path.lower().endswith('.csv'):
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['video_id', 'ref_words'] + [f"{name}_wer" for name in names])
+            for k, video_id in enumerate(common):
+                writer.writerow([video_id, totals[k]] + [rows[name][k]['wer'] for name in names])
+    elif report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({'files_compared': len(common), 'seconds': seconds, 'systems': summaries,
+                       'significance': significance, 'files': rows}, f, ensure_ascii=False, indent=2)
+    return rows, summaries, significance
+
+def print_comparison(rows, summaries, significance, align=False):
+    """Print the side-by-side system table, the pairwise tests and (optionally) the word alignments"""
+    names = list(summaries)
+    width = max(len(name) for name in names) + 2
+    level = f"{summaries[names[0]]['confidence']:.0%} CI" if names else "CI"
+
+    if align:
+        print("-" * 50)
+        print("Per-word alignment (C correct, S substitution, D deletion, I insertion):")
+        print("-" * 50)
+        for k, row in enumerate(rows[names[0]] if names else []):
+            print(f"File: {row['video_id']}")
+            for name in names:
+                errors = [f"{op}:{ref or '-'}>{hyp or '-'}" for op, ref, hyp in rows[name][k]['alignment'] if op != 'C']
+                print(f"  {name:<{width}} {' '.join(errors) if errors else '(no errors)'}")
+            print()
+
+    print("-" * 50)
+    print("System Comparison:")
+    print("-" * 50)
+    print(f"{'System':<{width}} {'Files':>6} {'Words':>8} {'S':>6} {'D':>6} {'I':>6} {'WER':>8} {level:>17} {'CER':>8}")
+    for name in names:
+        s = summaries[name]
+        ci = f"{s['wer_ci'][0]:.2%} - {s['wer_ci'][1]:.2%}"
+        print(f"{name:<{width}} {s['files_matched']:>6} {s['ref_words']:>8} {s['substitutions']:>6} "
+              f"{s['deletions']:>6} {s['insertions']:>6} {s['wer']:>8.2%} {ci:>17} {s['cer']:>8.2%}")
+
+    if significance:
+        print()
+        print("Paired bootstrap significance (WER a - WER b):")
+        for test in significance:
+            marker = " *" if test['p_value'] < 0.05 else ""
+            print(f"  {test['a']} vs {test['b']}: {test['wer_delta']:+.2%}, p = {test['p_value']:.4f}{marker}")
+
+def compare_main(ref_file_path, hyp_file_paths, band=None, jobs=None, report_path=None, bootstrap=1000, align=False):
+    reference_transcripts = parse_transcript_file(ref_file_path)
+    systems = {}
+    for path in hyp_file_paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        while name in systems:
+            name += "'"
+        systems[name] = parse_transcript_file(path)
+
+    if reference_transcripts is None or any(transcripts is None for transcripts in systems.values()):
+        print("Could not proceed due to file reading errors.")
+        return
+
+    rows, summaries, significance = compare_systems(reference_transcripts, systems, jobs=jobs, band=band,
+                                                    report_path=report_path, bootstrap=bootstrap, align=align)
+    files = summaries[next(iter(summaries))]['files_matched']
+    print(f"Comparing {len(systems)} systems on the {files} files present in the reference and every hypothesis file")
+    print_comparison(rows, summaries, significance, align)
+    if report_path:
+        print(f"Report saved to {report_path}")
+
+def main(ref_file_path, hyp_file_path, band=None, jobs=None, report_path=None, bootstrap=1000, quiet=False):
+    # Parse both files into dictionaries
+    reference_transcripts = parse_transcript_file(ref_file_path)
+    hypothesis_transcripts = parse_transcript_file(hyp_file_path)
+
+    if reference_transcripts is None or hypothesis_transcripts is None:
+        print("Could not proceed due to file reading errors.")
+        return
+
+    if not quiet:
+        print("-" * 50)
+        print("Individual File WER Calculation:")
+        print("-" * 50)
+
+    _, summary = evaluate_corpus(reference_transcripts, hypothesis_transcripts, jobs=jobs, band=band,
+                                 report_path=report_path, bootstrap=bootstrap, verbose=not quiet)
+    level = f"{summary['confidence']:.0%}"
 
     print("-" * 50)
     print("Overall Summary:")
     print("-" * 50)
-    print(f"Total files matched: {matched_files_count}")
-    print(f"Total words in reference: {total_reference_words}")
-    print(f"Total Substitutions: {total_substitutions}")
-    print(f"Total Deletions: {total_deletions}")
-    print(f"Total Insertions: {total_insertions}")
-    print(f"Overall Word Error Rate (WER): {overall_wer:.2%}")
+    print(f"Total files matched: {summary['files_matched']}")
+    print(f"Total words in reference: {summary['ref_words']}")
+    print(f"Total Substitutions: {summary['substitutions']}")
+    print(f"Total Deletions: {summary['deletions']}")
+    print(f"Total Insertions: {summary['insertions']}")
+    print(f"Overall Word Error Rate (WER): {summary['wer']:.2%} "
+          f"({level} CI {summary['wer_ci'][0]:.2%} - {summary['wer_ci'][1]:.2%})")
+    print(f"Overall Character Error Rate (CER): {summary['cer']:.2%} "
+          f"({level} CI {summary['cer_ci'][0]:.2%} - {summary['cer_ci'][1]:.2%})")
+    print(f"Scored in {summary['seconds']:.2f}s")
+    if report_path:
+        print(f"Report saved to {report_path}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Calculate Word Error Rate (WER) for transcript files keyed by video_id.")
     parser.add_argument("reference_file", help="The path to the ground truth reference file (format: video_id:text).")
-    parser.add_argument("hypothesis_file", help="The path to the hypothesis file to be checked (format: video_id:text).")
+    parser.add_argument("hypothesis_files", nargs='+',
+                        help="The path to the hypothesis file to be checked (format: video_id:text). "
+                             "Several files compare those systems side by side on the same reference.")
+    parser.add_argument("--band", type=int, default=None,
+                        help="Only align words at most this many positions apart; faster for near-matching texts, "
+                             "falls back to the full alignment when it would change the result.")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Number of worker processes (default: number of CPU cores).")
+    parser.add_argument("--report", default=None,
+                        help="Write per-file results and the summary to this file (.csv streams rows, anything else is JSON).")
+    parser.add_argument("--bootstrap", type=int, default=1000,
+                        help="Bootstrap resamples for the confidence intervals, 0 to skip (default: 1000).")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="Only print the overall summary.")
+    parser.add_argument("--align", action="store_true",
+                        help="When comparing systems, print and report the per-word error alignment of every file.")
     args = parser.parse_args()
     
-    main(args.reference_file, args.hypothesis_file)
\ No newline at end of file
+    if len(args.hypothesis_files) > 1:
+        compare_main(args.reference_file, args.hypothesis_files, args.band, args.jobs, args.report,
+                     args.bootstrap, args.align)
+    else:
+        main(args.reference_file, args.hypothesis_files[0], args.band, args.jobs, args.report,
+             args.bootstrap, args.quiet)